@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    In-place accumulation of max, mean and min spectra over a campaign. All per-sweep work is
+                done in persistent buffers with out= ufuncs so that nothing is allocated after the first
+                sweep, which matters for million-bin scans on the Pi.
+"""
+
+import numpy as np
+
+LN10_DIV10 = np.log(10)/10  # lin10(dB) = exp(dB*ln(10)/10)
+
+
+class SpectrumAggregator:
+    """Running max, mean (averaged in linear power) and min of dB spectra in the given dtype"""
+    def __init__(self, bins, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.magMax_dB = np.empty(bins, self.dtype)
+        self.magMin_dB = np.empty(bins, self.dtype)
+        self.magMean_lin = np.empty(bins, self.dtype)
+        self._mag = np.empty(bins, self.dtype)   # Sweep converted to working dtype
+        self._lin = np.empty(bins, self.dtype)   # Linear power / scratch
+        self._out = np.empty(bins, self.dtype)   # Output buffer for mean in dB
+
+    def update(self, mag_dB):
+        """Add sweep of dB magnitudes to the running products"""
+        mag = self._mag
+        lin = self._lin
+        np.copyto(mag, mag_dB, casting='same_kind')
+        np.multiply(mag, LN10_DIV10, out=lin)
+        np.exp(lin, out=lin)
+        if self.count == 0:
+            np.copyto(self.magMax_dB, mag)
+            np.copyto(self.magMin_dB, mag)
+            np.copyto(self.magMean_lin, lin)
+        else:
+            np.maximum(self.magMax_dB, mag, out=self.magMax_dB)
+            np.minimum(self.magMin_dB, mag, out=self.magMin_dB)
+            # Incremental mean keeps float32 accurate over long campaigns where a plain sum would not
+            np.subtract(lin, self.magMean_lin, out=lin)
+            np.multiply(lin, 1/(self.count + 1), out=lin)
+            np.add(self.magMean_lin, lin, out=self.magMean_lin)
+        self.count += 1
+
+    def magMean_dB(self):
+        """Return mean spectrum in dB. The returned array is reused on the next call"""
+        np.log10(self.magMean_lin, out=self._out)
+        np.multiply(self._out, 10, out=self._out)
+        return self._out
+
+
+class RollingWindow:
+    """Max, mean and min over the last span seconds, kept as a ring of per-interval partial products
+
+    Memory is bounded by the number of intervals, each sweep updates one interval in O(bins) and the
+    window is resolved to interval granularity when the products are requested. The linear power sum
+    and sweep count of the window are kept as running totals, and the max and min of the closed intervals
+    (all but the latest) are cached. Both are only rebuilt when an interval opens or rolls out of the window,
+    so resolving the products costs O(bins) per sweep, amortized over the intervals.
+    """
+    def __init__(self, bins, span, intervals, dtype=np.float64):
+        self.span = span
+        self.intervals = intervals
+        self.interval = span / intervals
+        self.dtype = np.dtype(dtype)
+        self._id = np.full(intervals, -1, np.int64)    # Absolute interval number held in each slot (-1 = empty)
+        self._count = np.zeros(intervals, np.int64)
+        self._sum_lin = np.zeros((intervals, bins), self.dtype)
+        self._max_dB = np.empty((intervals, bins), self.dtype)
+        self._min_dB = np.empty((intervals, bins), self.dtype)
+        self._lin = np.empty(bins, self.dtype)
+        # Window totals are kept in float64 as they sum many sweeps
+        self._total_lin = np.zeros(bins, np.float64)
+        self._total_count = 0
+        self._max_out = np.empty(bins, self.dtype)
+        self._mean_out = np.empty(bins, self.dtype)
+        self._min_out = np.empty(bins, self.dtype)
+        # Max and min over the closed intervals, valid while not _dirty
+        self._closed_max = np.empty(bins, self.dtype)
+        self._closed_min = np.empty(bins, self.dtype)
+        self._n_closed = 0
+        self._dirty = False
+        self._latest = -1
+
+    def _release(self, slots):
+        """Mark slots empty and rebuild the window totals from the intervals that remain
+
+        Rebuilding rather than subtracting keeps the totals exact when an expired interval held a strong
+        burst, next to which the weaker sweeps in its float32 partial sum were lost to rounding. This runs
+        at most once per interval.
+        """
+        self._id[slots] = -1
+        self._count[slots] = 0
+        self._dirty = True
+        self._total_count = int(self._count.sum())
+        self._total_lin.fill(0)
+        for slot in np.flatnonzero(self._id >= 0):
+            np.add(self._total_lin, self._sum_lin[slot], out=self._total_lin)
+
+    def _expire(self, latest):
+        """Remove intervals that have rolled out of the window ending in interval latest"""
+        if latest > self._latest:
+            self._latest = latest
+            self._dirty = True      # Previous latest interval is now closed
+        expired = np.flatnonzero((self._id >= 0) & (self._id <= self._latest - self.intervals))
+        if len(expired):
+            self._release(expired)
+
+    def _rebuild_closed(self):
+        """Reduce max and min over the intervals other than the latest into the closed cache"""
+        closed = np.flatnonzero((self._id >= 0) & (self._id != self._latest))
+        self._n_closed = len(closed)
+        if self._n_closed:
+            np.copyto(self._closed_max, self._max_dB[closed[0]])
+            np.copyto(self._closed_min, self._min_dB[closed[0]])
+            for slot in closed[1:]:
+                np.maximum(self._closed_max, self._max_dB[slot], out=self._closed_max)
+                np.minimum(self._closed_min, self._min_dB[slot], out=self._closed_min)
+        self._dirty = False
+
+    def update(self, timestamp, mag_dB):
+        """Add sweep taken at timestamp (seconds) to the interval it falls in"""
+        idx = int(timestamp // self.interval)
+        self._expire(idx)
+        if idx <= self._latest - self.intervals:
+            return      # Older than the window
+        slot = idx % self.intervals
+        np.multiply(mag_dB, LN10_DIV10, out=self._lin, casting='same_kind')
+        np.exp(self._lin, out=self._lin)
+        if idx != self._latest:
+            self._dirty = True      # Late sweep for a closed interval
+        if self._id[slot] != idx:
+            # Start interval afresh in this slot
+            if self._id[slot] >= 0:
+                self._release([slot])
+            self._id[slot] = idx
+            np.copyto(self._sum_lin[slot], self._lin)
+            np.copyto(self._max_dB[slot], mag_dB, casting='same_kind')
+            np.copyto(self._min_dB[slot], mag_dB, casting='same_kind')
+        else:
+            np.add(self._sum_lin[slot], self._lin, out=self._sum_lin[slot])
+            np.maximum(self._max_dB[slot], mag_dB, out=self._max_dB[slot], casting='same_kind')
+            np.minimum(self._min_dB[slot], mag_dB, out=self._min_dB[slot], casting='same_kind')
+        self._count[slot] += 1
+        self._total_count += 1
+        np.add(self._total_lin, self._lin, out=self._total_lin)
+
+    def products(self, timestamp=None):
+        """Return (max, mean, min) spectra in dB over the window ending at the latest sweep, or None if empty
+
+        If timestamp is later than the latest sweep, intervals that have rolled out of the window ending
+        at timestamp are expired first. The returned arrays are reused on the next call.
+        """
+        if timestamp is not None:
+            self._expire(int(timestamp // self.interval))
+        if not self._total_count:
+            return None
+        if self._dirty:
+            self._rebuild_closed()
+        slot = self._latest % self.intervals
+        if self._id[slot] != self._latest:
+            np.copyto(self._max_out, self._closed_max)
+            np.copyto(self._min_out, self._closed_min)
+        elif self._n_closed:
+            np.maximum(self._closed_max, self._max_dB[slot], out=self._max_out)
+            np.minimum(self._closed_min, self._min_dB[slot], out=self._min_out)
+        else:
+            np.copyto(self._max_out, self._max_dB[slot])
+            np.copyto(self._min_out, self._min_dB[slot])
+        np.multiply(self._total_lin, 1/self._total_count, out=self._mean_out, casting='same_kind')
+        np.log10(self._mean_out, out=self._mean_out)
+        np.multiply(self._mean_out, 10, out=self._mean_out)
+        return self._max_out, self._mean_out, self._min_out
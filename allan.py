@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Per-channel Allan variance at octave spaced averaging times (1, 2, 4, ... sweeps), updated
+                incrementally from each sweep with fixed memory per scale. Block means of each scale are
+                paired to form the blocks of the next scale, so only the previous block, a half-formed
+                block and the running sum of squared differences are kept per scale. The averaging time
+                with the lowest Allan variance shows where more integration stops helping because drift
+                takes over.
+"""
+
+import numpy as np
+
+
+class _Scale:
+    """State of one averaging time"""
+    def __init__(self, bins, dtype):
+        self.prev = np.empty(bins, dtype)       # Previous complete block mean
+        self.hold = np.empty(bins, dtype)       # First block of pair forming the next scale's block
+        self.sumsq = np.zeros(bins, dtype)      # Sum of squared differences of consecutive block means
+        self.has_prev = False
+        self.has_hold = False
+        self.n = 0                              # Number of differences in sumsq
+
+
+class AllanVariance:
+    """Non-overlapping Allan variance per channel at averaging times of 2**k sweeps, k < scales"""
+    def __init__(self, bins, scales=12, dtype=np.float64):
+        self.scales = [_Scale(bins, dtype) for k in range(scales)]
+        self._diff = np.empty(bins, dtype)
+        self._sum = np.zeros(bins, dtype)
+        self.count = 0
+
+    def update(self, y):
+        """Add sweep of values (e.g. linear power) per channel"""
+        self.count += 1
+        np.add(self._sum, y, out=self._sum)
+        for scale in self.scales:
+            if scale.has_prev:
+                np.subtract(y, scale.prev, out=self._diff)
+                np.square(self._diff, out=self._diff)
+                np.add(scale.sumsq, self._diff, out=scale.sumsq)
+                scale.n += 1
+            np.copyto(scale.prev, y)
+            scale.has_prev = True
+            if not scale.has_hold:
+                np.copyto(scale.hold, y)
+                scale.has_hold = True
+                return
+            # Second block of pair completes a block of the next scale
+            np.add(scale.hold, y, out=scale.hold)
+            np.multiply(scale.hold, 0.5, out=scale.hold)
+            scale.has_hold = False
+            y = scale.hold
+
+    def avar(self):
+        """Return Allan variance (scales x bins), NaN for scales without at least one difference"""
+        out = np.full((len(self.scales), len(self._diff)), np.nan)
+        for k, scale in enumerate(self.scales):
+            if scale.n:
+                out[k] = 0.5 * scale.sumsq / scale.n
+        return out
+
+    def mean(self):
+        """Return mean of all sweeps per channel"""
+        return self._sum / max(self.count, 1)
+
+    def counts(self):
+        """Number of block differences averaged at each scale"""
+        return np.array([scale.n for scale in self.scales])
+
+    def optimal_tau(self, sweep_period, bands=1, fractional=True, min_count=4):
+        """Return per band (channel slice, optimal tau in seconds, Allan variance at tau, drift limited)
+
+        The band's Allan variance is the median over its channels, normalised by the squared channel mean
+        if fractional. Scales with fewer than min_count differences are ignored. Drift limited is False when
+        the minimum lies at the longest usable scale, i.e. more integration may still lower the noise.
+        """
+        avar = self.avar()
+        if fractional:
+            avar = avar / np.square(self.mean())
+        usable = np.flatnonzero(self.counts() >= min_count)
+        results = []
+        for band in np.array_split(np.arange(avar.shape[1]), min(bands, avar.shape[1])):
+            band = slice(int(band[0]), int(band[-1]) + 1)
+            if not len(usable):
+                results.append((band, np.nan, np.nan, False))
+                continue
+            band_avar = np.median(avar[usable, band], axis=1)
+            k = usable[np.argmin(band_avar)]
+            results.append((band, sweep_period * 2**k, float(np.min(band_avar)), bool(k != usable[-1])))
+        return results
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Pack a finished campaign directory into a chunked, compressed archive and read it back.
+                magFull.txt is quantized to a chosen resolution in dB, delta coded along frequency and
+                compressed in independent chunks of rows so that a time range can be read without
+                unpacking the whole campaign. Campaigns recorded in linear power (settings.txt "linear")
+                are converted to dB before quantizing and back to linear power when unpacked. All other
+                campaign text files are stored verbatim.
+
+                Usage:  archive_campaign.py pack campaign/ campaign.skar [-r 0.01] [-c lzma]
+                        archive_campaign.py unpack campaign.skar campaign_copy/
+                        archive_campaign.py info campaign.skar
+"""
+
+import os, sys, json, zlib, lzma, struct, argparse, datetime, itertools
+
+import numpy as np
+
+MAGIC = b'SKAAPARC'
+VERSION = 1
+FOOTER = struct.Struct('<QQ8s')     # index offset, index length, magic
+
+codecs = {
+    'zlib': (lambda data, level: zlib.compress(data, 9 if level is None else level), zlib.decompress),
+    'lzma': (lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress),
+}
+
+
+def quantize_chunk(mag_dB, resolution):
+    """Quantize rows of dB values to integer steps of resolution and delta code along frequency"""
+    if not np.all(np.isfinite(mag_dB)):
+        raise ValueError('Magnitudes contain non-finite values and cannot be quantized!')
+    q = np.rint(mag_dB / resolution)
+    # Deltas are at most twice the largest step count, which must still fit in int32
+    if np.max(np.abs(q)) >= 2**30:
+        raise ValueError('Resolution {} dB is too small for magnitudes up to {:.1f} dB!'.format(
+            resolution, np.max(np.abs(mag_dB))))
+    q = q.astype(np.int32)
+    q[:, 1:] = np.diff(q, axis=1)
+    # Byte shuffle so that the mostly zero high bytes of the small deltas are grouped together
+    return np.ascontiguousarray(q.view(np.uint8).reshape(-1, 4).T).tobytes()
+
+
+def dequantize_chunk(data, rows, bins, resolution):
+    """Invert quantize_chunk and return rows of dB values"""
+    q = np.frombuffer(data, dtype=np.uint8).reshape(4, -1).T.copy().view('<i4').reshape(rows, bins)
+    return np.cumsum(q, axis=1, dtype=np.int64) * resolution
+
+
+def read_rows_text(fileID, rows):
+    """Read up to rows lines of space separated floats from an open text file"""
+    lines = list(itertools.islice(fileID, rows))
+    if not lines:
+        return None
+    return np.loadtxt(lines, dtype=float, ndmin=2)
+
+
+def is_linear(campaignPath):
+    """Return True if campaign was recorded in linear power according to its settings.txt"""
+    settings_fname = os.path.join(campaignPath, 'settings.txt')
+    if not os.path.exists(settings_fname):
+        return False
+    with open(settings_fname, 'r') as fileID:
+        return bool(json.load(fileID).get('linear', False))
+
+
+def to_dB(mag, linear):
+    """Return magnitudes read from magFull.txt in dB"""
+    if not linear:
+        return mag
+    if not np.all(mag > 0):
+        raise ValueError('Linear magnitudes must be positive to be archived in dB!')
+    return 10*np.log10(mag)
+
+
+def pack_campaign(campaignPath, archive_fname, resolution=0.01, chunk_rows=256, codec='zlib', level=None):
+    """Pack campaign directory into archive_fname. Returns (input bytes, archive bytes)"""
+    compress = codecs[codec][0]
+    linear = is_linear(campaignPath)
+    magFull_fname = os.path.join(campaignPath, 'magFull.txt')
+    freq = np.loadtxt(os.path.join(campaignPath, 'freq.txt'), dtype=float, ndmin=2)[0]
+    bytes_in = os.path.getsize(magFull_fname) + os.path.getsize(os.path.join(campaignPath, 'freq.txt'))
+    index = {'version': VERSION, 'codec': codec, 'resolution': resolution, 'bins': len(freq),
+             'linear': linear, 'rows': 0, 'chunks': [], 'files': {}}
+    with open(archive_fname, 'wb') as out:
+        out.write(MAGIC)
+        # Frequency vector is stored exactly
+        data = compress(freq.astype('<f8').tobytes(), level)
+        index['freq'] = {'offset': out.tell(), 'length': len(data)}
+        out.write(data)
+        # Other campaign files (settings, time, status, products) stored verbatim
+        for fname in sorted(os.listdir(campaignPath)):
+            fpath = os.path.join(campaignPath, fname)
+            if fname in ('magFull.txt', 'freq.txt') or not fname.endswith('.txt') or not os.path.isfile(fpath):
+                continue
+            with open(fpath, 'rb') as fileID:
+                raw = fileID.read()
+            bytes_in += len(raw)
+            data = compress(raw, level)
+            index['files'][fname] = {'offset': out.tell(), 'length': len(data)}
+            out.write(data)
+        # Magnitudes stored in independently compressed chunks of rows
+        with open(magFull_fname, 'r') as fileID:
+            while True:
+                mag_dB = read_rows_text(fileID, chunk_rows)
+                if mag_dB is None:
+                    break
+                if mag_dB.shape[1] != len(freq):
+                    raise ValueError('Row {} of magFull.txt does not match frequency vector!'.format(index['rows']))
+                data = compress(quantize_chunk(to_dB(mag_dB, linear), resolution), level)
+                index['chunks'].append({'offset': out.tell(), 'length': len(data),
+                                        'row_start': index['rows'], 'rows': len(mag_dB)})
+                out.write(data)
+                index['rows'] += len(mag_dB)
+        data = zlib.compress(json.dumps(index).encode())
+        offset = out.tell()
+        out.write(data)
+        out.write(FOOTER.pack(offset, len(data), MAGIC))
+        bytes_out = out.tell()
+    return bytes_in, bytes_out
+
+
+class CampaignArchive:
+    """Random access reader for archives written by pack_campaign"""
+    def __init__(self, archive_fname):
+        self._fileID = open(archive_fname, 'rb')
+        if self._fileID.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a campaign archive!'.format(archive_fname))
+        self._fileID.seek(-FOOTER.size, os.SEEK_END)
+        offset, length, magic = FOOTER.unpack(self._fileID.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError('{} is truncated!'.format(archive_fname))
+        self._fileID.seek(offset)
+        self.index = json.loads(zlib.decompress(self._fileID.read(length)))
+        if self.index['version'] > VERSION:
+            raise ValueError('Unsupported archive version {}'.format(self.index['version']))
+        self._decompress = codecs[self.index['codec']][1]
+        self.rows = self.index['rows']
+        self.bins = self.index['bins']
+        self.resolution = self.index['resolution']
+        self.linear = self.index.get('linear', False)
+        self.freq = np.frombuffer(self._read(self.index['freq']), dtype='<f8')
+
+    def _read(self, entry):
+        self._fileID.seek(entry['offset'])
+        return self._decompress(self._fileID.read(entry['length']))
+
+    def read_file(self, fname):
+        """Return contents of a verbatim stored campaign file as bytes"""
+        return self._read(self.index['files'][fname])
+
+    def read_rows(self, start=0, stop=None):
+        """Return magnitude rows [start, stop) in dB, decompressing only the chunks that overlap"""
+        start = max(start, 0)
+        stop = self.rows if stop is None else min(stop, self.rows)
+        out = np.empty((max(stop - start, 0), self.bins))
+        for chunk in self.index['chunks']:
+            c_start = chunk['row_start']
+            c_stop = c_start + chunk['rows']
+            if c_stop <= start or c_start >= stop:
+                continue
+            mag_dB = dequantize_chunk(self._read(chunk), chunk['rows'], self.bins, self.resolution)
+            lo, hi = max(start, c_start), min(stop, c_stop)
+            out[lo - start:hi - start] = mag_dB[lo - c_start:hi - c_start]
+        return out
+
+    def times(self):
+        """Return sweep start and end times from time.txt as lists of datetimes"""
+        start, end = [], []
+        for line in self.read_file('time.txt').decode().splitlines():
+            if line.strip():
+                t0, t1 = line.split(',')
+                start.append(datetime.datetime.fromisoformat(t0.strip()))
+                end.append(datetime.datetime.fromisoformat(t1.strip()))
+        return start, end
+
+    def read_time_range(self, t_start, t_stop):
+        """Return (row indices, magnitudes) of sweeps starting within [t_start, t_stop]"""
+        start, end = self.times()
+        rows = [i for i, t in enumerate(start) if t_start <= t <= t_stop]
+        if not rows:
+            return np.empty(0, int), np.empty((0, self.bins))
+        return np.arange(rows[0], rows[-1] + 1), self.read_rows(rows[0], rows[-1] + 1)
+
+    def unpack(self, campaignPath):
+        """Write campaign text files back into campaignPath"""
+        os.makedirs(campaignPath, exist_ok=True)
+        np.savetxt(os.path.join(campaignPath, 'freq.txt'), self.freq.reshape(1, -1), fmt='%.3f')
+        with open(os.path.join(campaignPath, 'magFull.txt'), 'w') as fileID:
+            for chunk in self.index['chunks']:
+                mag_dB = dequantize_chunk(self._read(chunk), chunk['rows'], self.bins, self.resolution)
+                if self.linear:
+                    np.savetxt(fileID, 10**(mag_dB/10), fmt='%.6e')
+                else:
+                    np.savetxt(fileID, mag_dB, fmt='%.6f')
+        for fname in self.index['files']:
+            with open(os.path.join(campaignPath, fname), 'wb') as fileID:
+                fileID.write(self.read_file(fname))
+
+    def close(self):
+        self._fileID.close()
+
+
+def verify_archive(campaignPath, archive):
+    """Return maximum absolute error in dB between magFull.txt and the archive"""
+    max_err = 0
+    with open(os.path.join(campaignPath, 'magFull.txt'), 'r') as fileID:
+        for chunk in archive.index['chunks']:
+            mag_dB = to_dB(read_rows_text(fileID, chunk['rows']), archive.linear)
+            archived = dequantize_chunk(archive._read(chunk), chunk['rows'], archive.bins, archive.resolution)
+            max_err = max(max_err, np.max(np.abs(archived - mag_dB)))
+    return max_err
+
+
+def setup_argument_parser():
+    """Setup command line parser"""
+    parser = argparse.ArgumentParser(description='Pack campaign text files into a compressed archive and back')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = subparsers.add_parser('pack', help='pack campaign directory into archive')
+    pack_parser.add_argument('campaign', help='campaign directory')
+    pack_parser.add_argument('archive', help='archive file to write')
+    pack_parser.add_argument('-r', '--resolution', metavar='dB', type=float, default=0.01,
+                             help='quantization step of magnitudes (default: %(default)s)')
+    pack_parser.add_argument('-n', '--chunk-rows', metavar='NUM', type=int, default=256,
+                             help='number of sweeps per independently compressed chunk (default: %(default)s)')
+    pack_parser.add_argument('-c', '--codec', choices=sorted(codecs.keys()), default='zlib',
+                             help='compression codec (default: %(default)s)')
+    pack_parser.add_argument('-l', '--level', metavar='NUM', type=int, default=None,
+                             help='compression level (default: 9 for zlib, 6 for lzma)')
+    pack_parser.add_argument('--verify', action='store_true',
+                             help='read archive back and check round-trip error')
+
+    unpack_parser = subparsers.add_parser('unpack', help='unpack archive into campaign directory')
+    unpack_parser.add_argument('archive', help='archive file to read')
+    unpack_parser.add_argument('campaign', help='campaign directory to write')
+
+    info_parser = subparsers.add_parser('info', help='show archive contents')
+    info_parser.add_argument('archive', help='archive file to read')
+    return parser
+
+
+def main():
+    args = setup_argument_parser().parse_args()
+    if args.command == 'pack':
+        bytes_in, bytes_out = pack_campaign(args.campaign, args.archive, args.resolution, args.chunk_rows,
+                                            args.codec, args.level)
+        print('Packed {} bytes into {} bytes (compression ratio {:.2f})'.format(bytes_in, bytes_out,
+                                                                              bytes_in / bytes_out))
+        if args.verify:
+            archive = CampaignArchive(args.archive)
+            max_err = verify_archive(args.campaign, archive)
+            archive.close()
+            print('Maximum round-trip error: {:.6f} dB (tolerance {:.6f} dB)'.format(max_err, args.resolution / 2))
+            if max_err > args.resolution / 2 + 1e-9:
+                sys.exit(1)
+    elif args.command == 'unpack':
+        archive = CampaignArchive(args.archive)
+        archive.unpack(args.campaign)
+        archive.close()
+    elif args.command == 'info':
+        archive = CampaignArchive(args.archive)
+        print('Sweeps: {}, bins: {}, resolution: {} dB, codec: {}, chunks: {}'.format(
+            archive.rows, archive.bins, archive.resolution, archive.index['codec'], len(archive.index['chunks'])))
+        print('Frequency range: {:.3f} - {:.3f} MHz'.format(archive.freq[0] / 1e6, archive.freq[-1] / 1e6))
+        print('Files: {}'.format(', '.join(sorted(archive.index['files']))))
+        archive.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Memory and throughput benchmark of SpectrumAggregator (float64 and float32) against the
+                original per-sweep aggregation in run_campaign.main()
+                Usage: bench_aggregate.py [bins] [sweeps]
+"""
+
+import sys, time, tracemalloc
+
+import numpy as np
+
+from aggregate import SpectrumAggregator
+
+
+def lin10(dB):
+    """Convert dB = 10*log10(A) to linear and return A (as in run_campaign)"""
+    return 10**(dB/10)
+
+
+class LegacyAggregator:
+    """Per-sweep aggregation as originally written in run_campaign.main()"""
+    def __init__(self, bins):
+        self.count = 0
+
+    def update(self, mag_dB):
+        if self.count == 0:
+            self.magMax_dB = np.copy(mag_dB)
+            self.magMin_dB = np.copy(mag_dB)
+            self.magMean_lin = lin10(mag_dB)
+        else:
+            self.magMean_lin = (self.magMean_lin+lin10(mag_dB))/(self.count+1)
+            self.magMax_dB[np.where(mag_dB>self.magMax_dB)] = mag_dB[np.where(mag_dB>self.magMax_dB)]
+            self.magMin_dB[np.where(mag_dB<self.magMin_dB)] = mag_dB[np.where(mag_dB<self.magMin_dB)]
+        self.count += 1
+
+
+def bench(name, agg, sweeps):
+    """Time updates after the first sweep and trace peak memory allocated during them"""
+    agg.update(sweeps[0])
+    tracemalloc.start()
+    t_start = time.perf_counter()
+    for mag_dB in sweeps[1:]:
+        agg.update(mag_dB)
+    t_total = time.perf_counter() - t_start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = len(sweeps) - 1
+    print('{:10s} {:10.2f} ms/sweep {:10.1f} Msamples/s {:10.2f} MB peak churn'.format(
+        name, 1e3*t_total/n, n*len(sweeps[0])/t_total/1e6, peak/1024**2))
+
+
+def main():
+    bins = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**6
+    Nsweeps = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rng = np.random.default_rng(0)
+    sweeps = [rng.normal(-80, 3, bins) for i in range(Nsweeps)]
+    print('bins: {}, sweeps: {}'.format(bins, Nsweeps))
+    bench('legacy', LegacyAggregator(bins), sweeps)
+    bench('float64', SpectrumAggregator(bins, np.float64), sweeps)
+    bench('float32', SpectrumAggregator(bins, np.float32), sweeps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Bandpass calibration tables built from reference sweeps and cached per receiver
+                configuration (frequency plan, gain, sample rate, bins). The correction is applied in place
+                once per sweep so that corrected products can be written alongside the untouched raw data.
+                The ripple follows the baseband offset within each hop rather than the RF frequency, so
+                tables for a different frequency plan at the same gain and rate are folded onto that offset
+                and interpolated at the offsets of the new plan's channels.
+
+                Usage: calibration.py campaign/ [calibration/] [-n SWEEPS]
+                       (builds a table from the first SWEEPS rows of magFull.txt using settings.txt)
+"""
+
+import os, json, hashlib, logging, datetime, argparse, itertools
+
+import numpy as np
+
+from aggregate import LN10_DIV10
+from freq_plan import FreqPlan
+
+logger = logging.getLogger(__name__)
+
+
+def gain_key(gain):
+    """Canonical string for total gain or dict of specific gains"""
+    if isinstance(gain, dict):
+        return ','.join('{}={:g}'.format(k, gain[k]) for k in sorted(gain))
+    return '{:g}'.format(gain)
+
+
+def plan_hash(freq):
+    """Hash of frequency grid rounded to the resolution written to freq.txt"""
+    return hashlib.sha1(np.round(np.asarray(freq, dtype=float), 3).tobytes()).hexdigest()[:16]
+
+
+def cal_key(freq, gain, rate, bins):
+    """Key of calibration table for a receiver configuration"""
+    return hashlib.sha1('{}|{}|{:g}|{}'.format(plan_hash(freq), gain_key(gain), rate, bins).encode()).hexdigest()[:16]
+
+
+def build_correction(mag_dB):
+    """Return per-channel correction in dB flattening the mean bandpass of reference sweeps (rows)
+
+    The correction is normalised to the median level so that the overall power scale is preserved.
+    """
+    bandpass_dB = 10*np.log10(np.mean(np.exp(np.atleast_2d(mag_dB)*LN10_DIV10), axis=0))
+    return np.median(bandpass_dB) - bandpass_dB
+
+
+def fold_correction(offset, correction_dB):
+    """Return (offsets, correction in dB) averaged over the channels at each baseband offset, in increasing
+    order of offset, where offset is the distance of each channel from the centre of its hop"""
+    profile_offset, inverse = np.unique(np.round(offset, 3), return_inverse=True)
+    counts = np.bincount(inverse)
+    return profile_offset, np.bincount(inverse, weights=correction_dB) / counts
+
+
+class CalibrationCache:
+    """Directory of calibration tables with an index.json keyed by receiver configuration"""
+    def __init__(self, path):
+        self.path = path
+        self._index_fname = os.path.join(path, 'index.json')
+        if os.path.exists(self._index_fname):
+            with open(self._index_fname, 'r') as fileID:
+                self.index = json.load(fileID)
+        else:
+            self.index = {}
+
+    def save(self, freq, correction_dB, gain, rate, bins, sweeps=0, offset=None):
+        """Store correction for configuration and return its key. Without the baseband offset of each channel
+        (see FreqPlan.offsets) the table is only used for the same frequency plan"""
+        os.makedirs(self.path, exist_ok=True)
+        key = cal_key(freq, gain, rate, bins)
+        tables = {'freq': freq, 'correction_dB': correction_dB}
+        if offset is not None:
+            tables['offset'] = offset
+        np.savez(os.path.join(self.path, key + '.npz'), **tables)
+        self.index[key] = {'gain': gain_key(gain), 'rate': rate, 'bins': bins, 'sweeps': sweeps,
+                           'freq_min': float(freq[0]), 'freq_max': float(freq[-1]), 'channels': len(freq),
+                           'folded': offset is not None, 'created': str(datetime.datetime.now())}
+        with open(self._index_fname, 'w') as fileID:
+            json.dump(self.index, fileID, indent=1)
+        return key
+
+    def _load(self, key):
+        with np.load(os.path.join(self.path, key + '.npz')) as data:
+            return {name: data[name] for name in data.files}
+
+    def lookup(self, freq, gain, rate, bins, offset=None):
+        """Return correction in dB on freq grid, or None if no suitable table exists
+
+        If the plan differs, a table of the same gain and rate is folded onto baseband offset and interpolated
+        at the offset of each channel, which requires offset. Channels at offsets outside the table are not
+        corrected.
+        """
+        key = cal_key(freq, gain, rate, bins)
+        if key in self.index:
+            return self._load(key)['correction_dB']
+        if offset is None:
+            return None
+        candidates = [(k, e) for k, e in self.index.items()
+                      if e['gain'] == gain_key(gain) and e['rate'] == rate and e.get('folded')
+                      and e['freq_min'] < freq[-1] and e['freq_max'] > freq[0]]
+        if not candidates:
+            return None
+        # Prefer the table covering most of the requested range, then the finest resolution
+        overlap = lambda e: min(e['freq_max'], freq[-1]) - max(e['freq_min'], freq[0])
+        key, entry = max(candidates, key=lambda c: (overlap(c[1]), c[1]['bins']))
+        table = self._load(key)
+        profile_offset, profile_dB = fold_correction(table['offset'], table['correction_dB'])
+        outside = np.count_nonzero((offset < profile_offset[0] - 1e-3) | (offset > profile_offset[-1] + 1e-3))
+        if outside:
+            logger.warning('{} of {} channels are outside calibration table {} and are not corrected'.format(
+                outside, len(freq), key))
+        return np.interp(offset, profile_offset, profile_dB, left=0, right=0)
+
+
+class Calibrator:
+    """Applies a per-channel correction to sweeps in place"""
+    def __init__(self, correction_dB, linear=False, dtype=np.float64):
+        self.correction_dB = np.asarray(correction_dB, dtype=dtype)
+        self.linear = linear
+        if linear:
+            self._correction_lin = np.exp(self.correction_dB*LN10_DIV10)
+
+    def apply(self, mag, out=None):
+        """Correct sweep into out (in place if out is mag). A gain in linear power is an offset in dB"""
+        if out is None:
+            out = np.empty_like(self.correction_dB)
+        if self.linear:
+            np.multiply(mag, self._correction_lin, out=out, casting='same_kind')
+        else:
+            np.add(mag, self.correction_dB, out=out, casting='same_kind')
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build bandpass calibration table from reference campaign')
+    parser.add_argument('campaign', help='reference campaign directory')
+    parser.add_argument('cache', nargs='?', default=os.getcwd()+'/calibration/',
+                        help='calibration cache directory (default: %(default)s)')
+    parser.add_argument('-n', '--sweeps', type=int, default=0,
+                        help='number of reference sweeps to use from start of campaign (0 = all)')
+    args = parser.parse_args()
+
+    with open(os.path.join(args.campaign, 'settings.txt'), 'r') as fileID:
+        settings = json.load(fileID)
+    freq = np.loadtxt(os.path.join(args.campaign, 'freq.txt'), dtype=float, ndmin=2)[0]
+    with open(os.path.join(args.campaign, 'magFull.txt'), 'r') as fileID:
+        lines = list(itertools.islice(fileID, args.sweeps or None))
+    mag_dB = np.loadtxt(lines, dtype=float, ndmin=2)
+    if settings.get('linear'):
+        mag_dB = 10*np.log10(mag_dB)
+    gain = settings['specific_gains'] if settings['specific_gains'] else settings['gain']
+    plan = FreqPlan.load(os.path.join(args.campaign, 'plan.npz'))
+    offset = plan.offsets() if plan is not None and len(plan.freq) == len(freq) else None
+    key = CalibrationCache(args.cache).save(freq, build_correction(mag_dB), gain, settings['rate'],
+                                            settings['bins'], len(mag_dB), offset)
+    print('Saved calibration {} from {} sweeps ({} channels)'.format(key, len(mag_dB), len(freq)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Background sampler for the temperature and humidity sensor within the receiver box.
+                Readings are kept in a timestamped ring so that each sweep can be tagged with the
+                ambient conditions at its start and end times without blocking the acquisition loop.
+"""
+
+import sys, time, logging, threading, collections
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def read_dht(sensor=11, pin=4, timeout=5.0, delay=0.5):
+    """Read (humidity, temperature) from DHT sensor, giving up after timeout seconds"""
+    import Adafruit_DHT     # Only available on the Pi, so import when first used
+    deadline = time.time() + timeout
+    while True:
+        humidity, temperature = Adafruit_DHT.read(sensor, pin)
+        if humidity is not None and temperature is not None:
+            return humidity, temperature
+        if time.time() + delay >= deadline:
+            return None, None
+        time.sleep(delay)
+
+
+class EnvSampler(threading.Thread):
+    """Thread which samples temperature and humidity at a fixed cadence into a ring of readings"""
+    def __init__(self, read_fn=None, interval=30.0, maxlen=2880, sensor=11, pin=4, timeout=5.0):
+        super().__init__(name='EnvSampler', daemon=True)
+        if read_fn is None:
+            read_fn = lambda: read_dht(sensor, pin, timeout=timeout)
+        self._read_fn = read_fn
+        self._interval = interval
+        self._ring = collections.deque(maxlen=maxlen)   # (timestamp, temperature, humidity)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.failed_reads = 0
+
+    def sample(self):
+        """Take a single reading and append it to the ring"""
+        t_read = time.time()
+        try:
+            humidity, temperature = self._read_fn()
+        except Exception as e:
+            logger.warning('Temperature/humidity read failed: {}'.format(e))
+            humidity, temperature = None, None
+        if humidity is None or temperature is None:
+            self.failed_reads += 1
+            return False
+        # Timestamp the reading halfway through the read as it may have taken several seconds
+        t_read = (t_read + time.time()) / 2
+        with self._lock:
+            self._ring.append((t_read, float(temperature), float(humidity)))
+        return True
+
+    def run(self):
+        while not self._stop_event.is_set():
+            t_next = time.time() + self._interval
+            self.sample()
+            self._stop_event.wait(max(0, t_next - time.time()))
+
+    def stop(self, timeout=None):
+        """Signal thread to stop and wait for it to finish"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def readings(self):
+        """Return copy of ring as arrays (timestamps, temperatures, humidities)"""
+        with self._lock:
+            ring = list(self._ring)
+        if not ring:
+            return np.empty(0), np.empty(0), np.empty(0)
+        t, temperature, humidity = np.array(ring).T
+        return t, temperature, humidity
+
+    def interpolate(self, timestamps, max_age=None):
+        """Return temperature and humidity interpolated to given timestamps
+
+        NaN is returned where there are no readings or the nearest reading is more than max_age seconds
+        (default: twice the sampling interval) away, e.g. when the sensor has stopped responding.
+        """
+        if max_age is None:
+            max_age = 2*self._interval
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=float))
+        t, temperature, humidity = self.readings()
+        if not len(t):
+            nan = np.full(timestamps.shape, np.nan)
+            return nan, nan.copy()
+        temperature = np.interp(timestamps, t, temperature)
+        humidity = np.interp(timestamps, t, humidity)
+        # Distance to nearest reading on either side of each timestamp
+        idx = np.searchsorted(t, timestamps)
+        nearest = np.minimum(np.abs(timestamps - t[np.clip(idx - 1, 0, len(t) - 1)]),
+                             np.abs(t[np.clip(idx, 0, len(t) - 1)] - timestamps))
+        stale = nearest > max_age
+        temperature[stale] = np.nan
+        humidity[stale] = np.nan
+        return temperature, humidity
+
+
+def main():
+    # Print readings at a fixed cadence until interrupted
+    sensor = int(sys.argv[1]) if len(sys.argv) > 1 else 11
+    DHT_DATA_PIN = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    interval = float(sys.argv[3]) if len(sys.argv) > 3 else 30.0
+    sampler = EnvSampler(interval=interval, sensor=sensor, pin=DHT_DATA_PIN)
+    sampler.start()
+    try:
+        while True:
+            time.sleep(interval)
+            t, temperature, humidity = sampler.readings()
+            if len(t):
+                print('{0:0.1f}, {1:0.1f}'.format(temperature[-1], humidity[-1]))
+            else:
+                print('Could not read Temperature')
+    except KeyboardInterrupt:
+        sampler.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Fixed-size thread pool serving several clients from their own bounded queues in round-robin
+                order, so that one client cannot starve another and a full queue blocks only its own client.
+                Each client has the submit() interface of a concurrent.futures executor.
+"""
+
+import os, time, threading, collections, concurrent.futures
+
+
+class PoolClient:
+    """Per-campaign view of FairPool with the submit() interface soapypower expects of an executor"""
+    def __init__(self, pool, name, max_queue_size):
+        self._pool = pool
+        self.name = name
+        self.max_queue_size = max_queue_size
+        self.max_queue_size_reached = 0
+        self._max_workers = pool.max_workers
+        self.queue = collections.deque()
+        self.submitted = 0
+        self.completed = 0
+        self.busy_time = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        return self._pool._submit(self, fn, args, kwargs)
+
+    def queue_depth(self):
+        return len(self.queue)
+
+
+class FairPool:
+    """Fixed number of worker threads serving per-client bounded queues in round-robin order"""
+    def __init__(self, max_workers=0, max_queue_size=0):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue_size = max_queue_size or self.max_workers * 10
+        self._clients = []
+        self._next = 0
+        self._shutdown = False
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._work_loop, name='PSD_pool_{}'.format(i), daemon=True)
+                         for i in range(self.max_workers)]
+        for t in self._threads:
+            t.start()
+
+    def client(self, name):
+        """Register a campaign and return its client"""
+        client = PoolClient(self, name, self.max_queue_size)
+        with self._cond:
+            self._clients.append(client)
+        return client
+
+    def _submit(self, client, fn, args, kwargs):
+        future = concurrent.futures.Future()
+        with self._cond:
+            # Block the submitting campaign only, when its own queue is full
+            while len(client.queue) >= client.max_queue_size and not self._shutdown:
+                self._cond.wait()
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            client.queue.append((future, fn, args, kwargs))
+            client.submitted += 1
+            client.max_queue_size_reached = max(client.max_queue_size_reached, len(client.queue))
+            self._cond.notify_all()
+        return future
+
+    def _take(self):
+        """Pop next work item, rotating over clients. Called with lock held"""
+        for i in range(len(self._clients)):
+            client = self._clients[(self._next + i) % len(self._clients)]
+            if client.queue:
+                self._next = (self._next + i + 1) % len(self._clients)
+                return client, client.queue.popleft()
+        return None, None
+
+    def _work_loop(self):
+        while True:
+            with self._cond:
+                client, item = self._take()
+                while item is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    client, item = self._take()
+                self._cond.notify_all()     # Space freed in client queue
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            t_start = time.time()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            with self._cond:
+                client.completed += 1
+                client.busy_time += time.time() - t_start
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
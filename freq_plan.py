@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Frequency plan compiled once per campaign configuration and persisted in plan.npz next to
+                freq.txt. It holds the hop centres, crop indices, the output frequency grid and a plan ID so
+                that sweeps can be validated by length against the plan instead of element-wise Python
+                checks, and so restarts and readers of freq.txt can reuse it.
+"""
+
+import os, json, hashlib
+
+import numpy as np
+
+
+def is_valid_grid(freq):
+    """Vectorized check that frequency grid is positive and strictly increasing"""
+    return len(freq) > 0 and bool(np.all(freq > 0)) and bool(np.all(np.diff(freq) > 0))
+
+
+class FreqPlan:
+    """Compiled frequency plan of a campaign"""
+    def __init__(self, key, bins, overlap, crop, sample_rate, lnb_lo, hops, freq=None):
+        self.key = key                      # Hash of the unresolved arguments the plan was compiled from
+        self.bins = int(bins)
+        self.overlap = float(overlap)
+        self.crop = bool(crop)
+        self.sample_rate = float(sample_rate)
+        self.lnb_lo = float(lnb_lo)
+        self.hops = np.asarray(hops, dtype=float)
+        self.crop_bins_half = round((self.overlap * self.bins) / 2) if self.crop else 0
+        self.channels_per_hop = self.bins - 2*self.crop_bins_half
+        self.channels = self.channels_per_hop * len(self.hops)
+        # Crop indices of each hop's FFT output and expected output grid as written by soapypower
+        self.crop_start = self.crop_bins_half
+        self.crop_stop = self.bins - self.crop_bins_half
+        base = np.fft.fftshift(np.fft.fftfreq(self.bins, 1 / self.sample_rate))[self.crop_start:self.crop_stop]
+        self.freq = (base[None, :] + self.lnb_lo + self.hops[:, None]).ravel() if freq is None else np.asarray(freq)
+        self.plan_id = hashlib.sha1(json.dumps([self.bins, self.crop_bins_half, self.sample_rate, self.lnb_lo,
+                                                self.hops.tolist()]).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def args_key(args, sample_rate):
+        """Hash of the command line arguments that determine the plan, before they are resolved, together
+        with the device and the sample rate it actually runs at"""
+        return hashlib.sha1(json.dumps([args.device, args.freq, args.bins, args.bin_size, args.even, args.pow2,
+                                        args.overlap, args.crop, args.rate, float(sample_rate),
+                                        args.lnb_lo]).encode()).hexdigest()[:16]
+
+    @classmethod
+    def compile(cls, sdr, args, key):
+        """Compile plan from resolved args (bins, overlap, crop) and SoapyPower instance"""
+        hops = sdr.freq_plan(args.freq[0] - args.lnb_lo, args.freq[1] - args.lnb_lo, args.bins, args.overlap,
+                             quiet=True)
+        return cls(key, args.bins, args.overlap, args.crop, sdr.device.sample_rate, args.lnb_lo, hops)
+
+    def apply(self, args):
+        """Set resolved sweep arguments of plan on args"""
+        args.bins = self.bins
+        args.overlap = self.overlap
+        args.crop = self.crop
+
+    def bind(self, freq):
+        """Adopt frequency grid of first sweep after checking it against the plan. Returns False if invalid"""
+        freq = np.asarray(freq, dtype=float)
+        if len(freq) != self.channels or not is_valid_grid(freq):
+            return False
+        if not np.allclose(freq, self.freq, rtol=0, atol=1e-3):
+            return False
+        self.freq = freq.copy()
+        return True
+
+    def check(self, freq, debug=False):
+        """Check sweep frequency vector against plan, by length only unless debug
+
+        Every sweep of a campaign is made with the plan's own bins, overlap, crop and hops, so its plan ID
+        (a hash of exactly those) cannot differ from the plan's. What can go wrong is a hop missing from
+        or repeated in the output, which changes the length.
+        """
+        if len(freq) != self.channels:
+            return False
+        if debug:
+            return is_valid_grid(freq) and bool(np.array_equal(freq, self.freq))
+        return True
+
+    def offsets(self):
+        """Return baseband offset of each channel from the centre of its hop"""
+        return self.freq - self.lnb_lo - np.repeat(self.hops, self.channels_per_hop)
+
+    def save(self, filepath):
+        np.savez(filepath, key=self.key, plan_id=self.plan_id, bins=self.bins, overlap=self.overlap, crop=self.crop,
+                 sample_rate=self.sample_rate, lnb_lo=self.lnb_lo, hops=self.hops, freq=self.freq)
+
+    @classmethod
+    def load(cls, filepath):
+        """Load plan saved by save(), returning None if there is none"""
+        if not os.path.exists(filepath):
+            return None
+        with np.load(filepath) as data:
+            return cls(str(data['key']), int(data['bins']), float(data['overlap']), bool(data['crop']),
+                       float(data['sample_rate']), float(data['lnb_lo']), data['hops'], data['freq'])
+
+
+def load_freq(campaignPath):
+    """Return frequency grid of campaign, from plan.npz if present, otherwise from freq.txt"""
+    plan = FreqPlan.load(os.path.join(campaignPath, 'plan.npz'))
+    if plan is not None:
+        return plan.freq
+    return np.loadtxt(os.path.join(campaignPath, 'freq.txt'), dtype=float, ndmin=2)[0]
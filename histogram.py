@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Per-channel power histograms (channel x dB bin) accumulated over a campaign in constant
+                memory. Median and percentile spectra and occupancy above a threshold are derived from the
+                histogram on demand, which makes them robust to the single outliers that drive max and min.
+"""
+
+import os, math
+
+import numpy as np
+
+
+CHUNK_ROWS = 4096  # Channels per block when resolving percentiles, bounds the temporary buffers
+
+
+class PowerHistogram:
+    """Fixed-bin histogram of dB values per channel with underflow and overflow columns"""
+    def __init__(self, bins, dB_min=-120.0, dB_max=0.0, dB_step=0.5, counts=None, count=0):
+        self.dB_min = float(dB_min)
+        self.dB_step = float(dB_step)
+        if counts is None:
+            self.nbins = math.ceil((dB_max - dB_min) / dB_step)
+        else:
+            # Rounded dB_max may not give back the same number of bins, so take it from the counts
+            self.nbins = counts.shape[1] - 2
+        self.dB_max = self.dB_min + self.nbins*self.dB_step
+        self.count = count
+        # Column 0 is underflow, columns 1..nbins are dB bins, column nbins+1 is overflow
+        if counts is None:
+            counts = np.zeros((bins, self.nbins + 2), np.uint32)
+        self.counts = counts
+        self._flat = self.counts.reshape(-1)
+        self._offsets = np.arange(bins, dtype=np.int64) * (self.nbins + 2)
+        self._work = np.empty(bins, np.float64)
+        self._idx = np.empty(bins, np.int64)
+        self._cum = None    # Cumulative counts of a block of channels, allocated on first use
+
+    def edges(self):
+        """Return dB edges of the histogram bins (excluding underflow and overflow)"""
+        return self.dB_min + self.dB_step*np.arange(self.nbins + 1)
+
+    def update(self, mag_dB):
+        """Add sweep of dB values, one count per channel"""
+        work = self._work
+        np.subtract(mag_dB, self.dB_min, out=work)
+        np.divide(work, self.dB_step, out=work)
+        np.floor(work, out=work)
+        np.nan_to_num(work, copy=False, nan=-1.0, posinf=self.nbins, neginf=-1.0)
+        np.clip(work, -1, self.nbins, out=work)
+        np.add(work, 1, out=work)
+        np.copyto(self._idx, work, casting='unsafe')
+        np.add(self._idx, self._offsets, out=self._idx)
+        # Every channel contributes exactly one index, so there are no repeats and += is safe
+        self._flat[self._idx] += 1
+        self.count += 1
+
+    def percentiles(self, qs):
+        """Return list of per-channel q-th percentiles in dB for each q in qs, linearly interpolated within
+        the histogram bin. All percentiles are resolved from one cumulative sum per block of channels"""
+        if not self.count:
+            raise ValueError('Histogram is empty!')
+        bins, ncols = self.counts.shape
+        if self._cum is None:
+            rows = min(bins, CHUNK_ROWS)
+            self._cum = np.empty((rows, ncols), np.uint32)
+            self._below = np.empty((rows, ncols), bool)
+            self._col = np.empty((rows, 1), np.int64)
+        values = [np.empty(bins) for q in qs]
+        for r0 in range(0, bins, len(self._cum)):
+            counts = self.counts[r0:r0 + len(self._cum)]
+            n = len(counts)
+            cum, below, col = self._cum[:n], self._below[:n], self._col[:n]
+            np.cumsum(counts, axis=1, out=cum)
+            for q, value in zip(qs, values):
+                target = max(q / 100 * self.count, 1e-9)
+                # First column reaching target is the number of columns below it, as cum is non-decreasing
+                np.less(cum, target, out=below)
+                np.sum(below, axis=1, out=col[:, 0])
+                hits = np.take_along_axis(counts, col, axis=1)[:, 0]
+                frac = (target - (np.take_along_axis(cum, col, axis=1)[:, 0] - hits)) / np.maximum(hits, 1)
+                value[r0:r0 + n] = self.dB_min + self.dB_step*(col[:, 0] - 1 + np.clip(frac, 0, 1))
+        # Underflow and overflow cannot be resolved further than the histogram range
+        for value in values:
+            np.clip(value, self.dB_min, self.dB_max, out=value)
+        return values
+
+    def percentile(self, q):
+        """Return per-channel q-th percentile in dB, linearly interpolated within the histogram bin"""
+        return self.percentiles([q])[0]
+
+    def median(self):
+        return self.percentile(50)
+
+    def occupancy(self, threshold_dB):
+        """Return per-channel fraction of sweeps at or above threshold_dB (rounded up to a bin edge)"""
+        if not self.count:
+            raise ValueError('Histogram is empty!')
+        col = 1 + min(max(math.ceil((threshold_dB - self.dB_min) / self.dB_step - 1e-9), -1), self.nbins)
+        return self.counts[:, col:].sum(axis=1) / self.count
+
+    def save(self, filepath):
+        """Checkpoint histogram to .npz file, replacing any previous checkpoint only once fully written"""
+        tmp_fname = filepath + '.tmp'
+        with open(tmp_fname, 'wb') as fileID:
+            np.savez(fileID, counts=self.counts, count=self.count,
+                     dB_min=self.dB_min, dB_max=self.dB_max, dB_step=self.dB_step)
+        os.replace(tmp_fname, filepath)
+
+    def same_bins(self, other):
+        """Return True if other histogram has the same dB bins"""
+        return (self.dB_min, self.dB_step, self.nbins) == (other.dB_min, other.dB_step, other.nbins)
+
+    @classmethod
+    def load(cls, filepath):
+        """Restore histogram from checkpoint written by save()"""
+        with np.load(filepath) as data:
+            return cls(data['counts'].shape[0], float(data['dB_min']), float(data['dB_max']), float(data['dB_step']),
+                       counts=data['counts'].copy(), count=int(data['count']))
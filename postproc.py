@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Post-processing stage which hands each sweep to worker processes through shared memory
+                so that statistics, product updates, file writing and other heavy analysis never compete
+                with the PSD threads of the acquisition loop. Results are returned in sweep order. Arrays
+                that are the same for every sweep (e.g. the frequency grid) are given to the workers once.
+
+                Stateful tasks such as products.CampaignProducts see every sweep in order when run by a
+                single worker with the blocking policy, and are closed when the workers are stopped.
+"""
+
+import time, logging, queue, multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+POLL_INTERVAL = 1.0     # Seconds between worker liveness checks while waiting for results
+
+
+def sweep_stats(Nsweep, freq, mag_dB):
+    """Default post-processing task returning summary statistics of a single sweep"""
+    i_max = int(np.argmax(mag_dB))
+    return {'Nsweep': Nsweep,
+            'mean': float(10*np.log10(np.mean(10**(mag_dB/10)))),
+            'max': float(mag_dB[i_max]),
+            'freq_max': float(freq[i_max]),
+            'min': float(np.min(mag_dB))
+            }
+
+
+def _worker(task, shm_name, shape, names, constants, tasks, results):
+    """Worker process attaching to shared slots and running task on each submitted sweep"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    arrays = None
+    while True:
+        job = tasks.get()
+        if job is None:
+            break
+        Nsweep, slot, info = job
+        arrays = {name: slots[slot, i] for i, name in enumerate(names)}
+        try:
+            results.put((Nsweep, slot, task(Nsweep, **constants, **info, **arrays), None))
+        except Exception as e:
+            results.put((Nsweep, slot, None, repr(e)))
+    del arrays, slots
+    shm.close()
+    if hasattr(task, 'close'):
+        try:
+            task.close()
+        except Exception:
+            logger.exception('Closing post-processing task failed')
+
+
+class PostProcessor:
+    """Runs task(Nsweep, **constants, **info, **arrays) on each sweep in worker processes using a fixed set of
+    shared memory slots. constants are sent to each worker once, info is a small dict sent with each sweep
+
+    policy='block' waits for a free slot (backpressure on the sweep loop), policy='drop' skips the sweep
+    and counts it in dropped. Memory use is bounded by the number of slots. If a worker process dies the
+    remaining workers are stopped, sweeps in flight are skipped and later sweeps are dropped, so that the
+    sweep loop is never blocked by a dead worker.
+    """
+    def __init__(self, bins, task=sweep_stats, names=('mag_dB',), constants=None, workers=1, slots=4,
+                 policy='block', timeout=None):
+        if policy not in ('block', 'drop'):
+            raise ValueError('Unknown post-processing policy: {}'.format(policy))
+        self._names = tuple(names)
+        self._policy = policy
+        self._timeout = timeout
+        shape = (slots, len(self._names), bins)
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape))*8)
+        self._slots = np.ndarray(shape, dtype=np.float64, buffer=self._shm.buf)
+        self._free = list(range(slots))
+        ctx = multiprocessing.get_context('spawn')
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._workers = [ctx.Process(target=_worker, name='PostProc_{}'.format(i), daemon=True,
+                                     args=(task, self._shm.name, shape, self._names, constants or {}, self._tasks,
+                                           self._results))
+                         for i in range(workers)]
+        for w in self._workers:
+            w.start()
+        self._pending = {}          # Nsweep -> result, waiting for earlier sweeps
+        self._skipped = set()       # Dropped sweeps which will never produce a result
+        self._next = None           # Next Nsweep to be returned
+        self._in_flight = {}        # slot -> Nsweep submitted to workers
+        self.failed = False
+        self.submitted = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def _check_workers(self):
+        """Stop post-processing if a worker has died. Returns True if post-processing has failed"""
+        if not self.failed and all(w.is_alive() for w in self._workers):
+            return False
+        if not self.failed:
+            dead = [w.name for w in self._workers if not w.is_alive()]
+            logger.error('Post-processing worker {} died, skipping {} sweeps in flight and dropping further '
+                         'sweeps'.format(', '.join(dead), len(self._in_flight)))
+            self.failed = True
+            # Surviving workers may still be writing to the slots, so stop them before the slots are reused
+            for w in self._workers:
+                if w.is_alive():
+                    w.terminate()
+            for w in self._workers:
+                w.join()
+            self._skipped.update(self._in_flight.values())
+            self._free.extend(self._in_flight)
+            self._in_flight.clear()
+        return True
+
+    def _collect(self, block=False, timeout=None):
+        """Move finished results from workers into pending and free their slots
+
+        When blocking, waits up to timeout seconds (forever if None) for at least one result, checking
+        the workers every POLL_INTERVAL seconds and returning early if one has died.
+        """
+        got = False
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = block and not got and not self.failed
+            poll = POLL_INTERVAL if deadline is None else max(min(POLL_INTERVAL, deadline - time.time()), 0)
+            try:
+                Nsweep, slot, result, error = self._results.get(wait, poll)
+            except queue.Empty:
+                if (not wait or self._check_workers()
+                        or (deadline is not None and time.time() >= deadline)):
+                    return got
+                continue
+            if self._in_flight.get(slot) != Nsweep:
+                continue    # Sweep was already skipped after a worker died
+            got = True
+            self._free.append(slot)
+            del self._in_flight[slot]
+            if error is not None:
+                logger.warning('Post-processing of sweep {} failed: {}'.format(Nsweep, error))
+                self.errors += 1
+                self._skipped.add(Nsweep)
+            else:
+                self._pending[Nsweep] = result
+
+    def submit(self, Nsweep, info=None, **arrays):
+        """Copy arrays of sweep Nsweep into a free slot and queue it with info. Returns False if the sweep was
+        dropped"""
+        if self._next is None:
+            self._next = Nsweep
+        self._collect()
+        self._check_workers()
+        if not self._free and self._policy == 'block':
+            while not self._free and not self.failed:
+                if not self._collect(block=True, timeout=self._timeout) and self._timeout is not None:
+                    break
+        if not self._free or self.failed:
+            self.dropped += 1
+            self._skipped.add(Nsweep)
+            if not self.failed:
+                logger.warning('Post-processing is behind, dropped sweep {} ({} dropped)'.format(
+                    Nsweep, self.dropped))
+            return False
+        slot = self._free.pop()
+        for i, name in enumerate(self._names):
+            np.copyto(self._slots[slot, i], arrays[name])
+        self._tasks.put((Nsweep, slot, info or {}))
+        self._in_flight[slot] = Nsweep
+        self.submitted += 1
+        return True
+
+    def results(self, wait=False):
+        """Return list of (Nsweep, result) in sweep order that are ready, waiting for all in flight if wait"""
+        self._collect()
+        while wait and self._in_flight:
+            self._collect(block=True)
+        ready = []
+        while self._next is not None:
+            if self._next in self._pending:
+                ready.append((self._next, self._pending.pop(self._next)))
+            elif self._next in self._skipped:
+                self._skipped.discard(self._next)
+            else:
+                break
+            self._next += 1
+        return ready
+
+    def queue_depth(self):
+        """Number of sweeps submitted but not yet finished"""
+        return len(self._in_flight)
+
+    def close(self, timeout=10.0):
+        """Wait for outstanding work, stop workers and release shared memory. Returns remaining results
+
+        Workers still running timeout seconds after being asked to stop are terminated (None waits for them
+        to finish closing their task). The shared memory is released even if waiting for the workers fails.
+        """
+        try:
+            ready = self.results(wait=True)
+            for w in self._workers:
+                self._tasks.put(None)
+            for w in self._workers:
+                w.join(timeout)
+                if w.is_alive():
+                    logger.warning('Post-processing worker {} did not stop, terminating it'.format(w.name))
+                    w.terminate()
+                    w.join()
+        finally:
+            del self._slots
+            self._shm.close()
+            self._shm.unlink()
+        return ready
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Accumulated campaign products and the files they are written to: the full magnitude record,
+                max/mean/min spectra, calibrated spectra, rolling windows, power histograms and Allan
+                variance. CampaignProducts is called once per sweep, in sweep order, either inline in the
+                sweep loop or as the task of a single post-processing worker so that the updates and file
+                writes run beside the acquisition instead of between sweeps.
+"""
+
+import os, logging
+
+import numpy as np
+
+from aggregate import SpectrumAggregator, RollingWindow, LN10_DIV10
+from histogram import PowerHistogram
+from calibration import CalibrationCache, Calibrator, build_correction
+from allan import AllanVariance
+from freq_plan import FreqPlan
+
+logger = logging.getLogger(__name__)
+
+
+def write_histogram_products(histogram, campaignPath, occupancy_threshold=None):
+    """Write median, 5th and 95th percentile spectra and optionally occupancy derived from histogram"""
+    magP05, magMedian, magP95 = histogram.percentiles([5, 50, 95])
+    np.savetxt(campaignPath+'magMedian.txt', magMedian.reshape(1,-1), fmt='%.6f')
+    np.savetxt(campaignPath+'magP05.txt', magP05.reshape(1,-1), fmt='%.6f')
+    np.savetxt(campaignPath+'magP95.txt', magP95.reshape(1,-1), fmt='%.6f')
+    if occupancy_threshold is not None:
+        np.savetxt(campaignPath+'occupancy.txt', histogram.occupancy(occupancy_threshold).reshape(1,-1), fmt='%.6f')
+
+
+def write_allan_products(allan, freq, sweep_period, bands, campaignPath):
+    """Write fractional Allan variance per scale and channel, and optimal integration time per band"""
+    avar = allan.avar() / np.square(allan.mean())
+    with open(campaignPath+'allan.txt', 'w') as fileID:
+        fileID.write('# tau [s]: {}\n'.format(', '.join('{:.3f}'.format(sweep_period * 2**k)
+                                                        for k in range(len(avar)))))
+        np.savetxt(fileID, avar, fmt='%.6e')
+    with open(campaignPath+'allanTau.txt', 'w') as fileID:
+        fileID.write('# freq start [Hz], freq stop [Hz], optimal tau [s], Allan variance, drift limited\n')
+        for band, tau, band_avar, drift_limited in allan.optimal_tau(sweep_period, bands):
+            fileID.write('{:.3f}, {:.3f}, {:.3f}, {:.6e}, {:d}\n'.format(
+                freq[band.start], freq[band.stop - 1], tau, band_avar, drift_limited))
+
+
+class CampaignProducts:
+    """Products of a campaign configured by run_campaign.py args, updated by calling it with each sweep
+
+    The state is created on the first sweep. Sweeps must be passed in order and none may be skipped, so as a
+    post-processing task it needs a single worker and the blocking policy.
+    """
+    def __init__(self, args, campaignPath):
+        self.args = args
+        self.campaignPath = campaignPath
+        self.sweeps = 0
+        self.freq = None
+
+    def _setup(self, freq, start):
+        args = self.args
+        bins = len(freq)
+        self.freq = freq
+        # Max, mean and min spectrums accumulated in place in persistent buffers
+        self.aggregator = SpectrumAggregator(bins, np.float32 if args.float32 else np.float64)
+        dtype = self.aggregator.dtype
+        # Bandpass calibration, corrected products are accumulated separately from the raw data
+        self.calCache = CalibrationCache(args.cal_dir) if args.cal_build or args.cal_apply else None
+        self.calGain = args.specific_gains if args.specific_gains else args.gain
+        self.calibrator = None
+        self.calRef = SpectrumAggregator(bins) if args.cal_build else None
+        self.calOffset = None
+        if self.calCache:
+            # Baseband offset of each channel within its hop, which the bandpass ripple follows
+            plan = FreqPlan.load(self.campaignPath+'plan.npz')
+            if plan is not None and len(plan.freq) == bins:
+                self.calOffset = plan.offsets()
+        if args.cal_apply:
+            correction_dB = self.calCache.lookup(freq, self.calGain, args.rate, args.bins, self.calOffset)
+            if correction_dB is None:
+                logger.warning('No calibration found in {} for these settings'.format(args.cal_dir))
+            else:
+                self._start_calibrated(correction_dB)
+        self.histogram = None
+        if args.hist_step:
+            hist_fname = self.campaignPath+'histogram.npz'
+            self.histogram = PowerHistogram(bins, args.hist_min, args.hist_max, args.hist_step)
+            if args.hist_resume and os.path.exists(hist_fname):
+                checkpoint = PowerHistogram.load(hist_fname)
+                if checkpoint.counts.shape[0] != bins:
+                    raise ValueError('Histogram checkpoint does not match frequency vector!')
+                if not checkpoint.same_bins(self.histogram):
+                    raise ValueError('Histogram checkpoint does not match --hist-min/--hist-max/--hist-step!')
+                self.histogram = checkpoint
+        if args.allan_scales:
+            self.allan = AllanVariance(bins, args.allan_scales)
+            self.allanLin = np.empty(bins)
+            self.allan_first_start = start
+            self.sweep_period = 0.0
+        else:
+            self.allan = None
+        self.windows = {name: RollingWindow(bins, span, intervals, dtype)
+                        for name, (span, intervals) in args.windows.items()}
+
+    def _start_calibrated(self, correction_dB):
+        dtype = self.aggregator.dtype
+        self.calibrator = Calibrator(correction_dB, self.args.linear, dtype)
+        self.magCal = np.empty(len(self.freq), dtype)
+        self.aggregatorCal = SpectrumAggregator(len(self.freq), dtype)
+
+    def __call__(self, Nsweep, freq, mag_dB, start, end):
+        """Add sweep Nsweep (counted from 0) taken from start to end and write the updated products"""
+        args = self.args
+        campaignPath = self.campaignPath
+        if self.freq is None:
+            self._setup(freq, start)
+        self.aggregator.update(mag_dB)
+        if self.sweeps == 0:     # Initialise output files on the first sweep
+            np.savetxt(campaignPath+'magFull.txt', mag_dB.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMax.txt', mag_dB.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMean.txt', mag_dB.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMin.txt', mag_dB.reshape(1,-1), fmt='%.6f')
+            with open(campaignPath+'time.txt', 'w') as fileID:
+                fileID.write('{}, {}\n'.format(start, end))
+        else:
+            np.savetxt(campaignPath+'magMax.txt', self.aggregator.magMax_dB.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMin.txt', self.aggregator.magMin_dB.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMean.txt', self.aggregator.magMean_dB().reshape(1,-1), fmt='%.6f')
+            with open(campaignPath+'magFull.txt', 'a') as fileID:    # Append scan to full magnitude data file
+                np.savetxt(fileID, mag_dB.reshape(1,-1), fmt='%.6f')
+            with open(campaignPath+'time.txt', 'a') as fileID:
+                fileID.write('{}, {}\n'.format(start, end))
+        self.sweeps += 1
+
+        # Accumulate reference sweeps for calibration, or correct sweep and update calibrated products
+        if self.calRef:
+            self.calRef.update(10*np.log10(mag_dB) if args.linear else mag_dB)
+            if self.calRef.count == args.cal_build:
+                correction_dB = build_correction(self.calRef.magMean_dB())
+                key = self.calCache.save(freq, correction_dB, self.calGain, args.rate, args.bins, self.calRef.count,
+                                         self.calOffset)
+                logger.info('Saved calibration {} from {} sweeps'.format(key, self.calRef.count))
+                self._start_calibrated(correction_dB)
+                self.calRef = None
+        elif self.calibrator:
+            self.calibrator.apply(mag_dB, out=self.magCal)
+            self.aggregatorCal.update(self.magCal)
+            np.savetxt(campaignPath+'magMaxCal.txt', self.aggregatorCal.magMax_dB.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMeanCal.txt', self.aggregatorCal.magMean_dB().reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMinCal.txt', self.aggregatorCal.magMin_dB.reshape(1,-1), fmt='%.6f')
+
+        # Update and save rolling window products
+        for name, window in self.windows.items():
+            window.update(start.timestamp(), mag_dB)
+            magMax_win, magMean_win, magMin_win = window.products()
+            np.savetxt(campaignPath+'magMax_{}.txt'.format(name), magMax_win.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMean_{}.txt'.format(name), magMean_win.reshape(1,-1), fmt='%.6f')
+            np.savetxt(campaignPath+'magMin_{}.txt'.format(name), magMin_win.reshape(1,-1), fmt='%.6f')
+
+        # Update power histograms, writing percentile spectra and checkpoint periodically
+        if self.histogram:
+            self.histogram.update(mag_dB)
+            if (Nsweep+1) % args.hist_every == 0:
+                write_histogram_products(self.histogram, campaignPath, args.occupancy_threshold)
+                self.histogram.save(campaignPath+'histogram.npz')
+
+        # Update Allan variance from linear power, writing products periodically
+        if self.allan:
+            if args.linear:
+                np.copyto(self.allanLin, mag_dB)
+            else:
+                np.multiply(mag_dB, LN10_DIV10, out=self.allanLin)
+                np.exp(self.allanLin, out=self.allanLin)
+            self.allan.update(self.allanLin)
+            if self.allan.count > 1:
+                self.sweep_period = (start - self.allan_first_start).total_seconds() / (self.allan.count - 1)
+                if self.allan.count % args.allan_every == 0:
+                    write_allan_products(self.allan, freq, self.sweep_period, args.allan_bands, campaignPath)
+
+    def close(self):
+        """Write final histogram and Allan variance products at the end of the campaign"""
+        if not self.sweeps:
+            return
+        if self.histogram:
+            write_histogram_products(self.histogram, self.campaignPath, self.args.occupancy_threshold)
+            self.histogram.save(self.campaignPath+'histogram.npz')
+        if self.allan and self.allan.count > 1:
+            write_allan_products(self.allan, self.freq, self.sweep_period, self.args.allan_bands, self.campaignPath)
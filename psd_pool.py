@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Bounded PSD worker pool shared by several campaigns in one process. Each campaign submits
+                through its own client queue and workers serve the queues round-robin, so one receiver
+                cannot starve another and the Pi's cores are not oversubscribed by one pool per device.
+                The pool itself is in fair_pool.py, this module adapts soapypower to it. Import only after
+                setting log level, as it imports soapypower.power.
+"""
+
+import logging
+
+from soapypower import power, psd
+from soapypower.version import __version__ as soapypower_version
+
+logger = logging.getLogger(__name__)
+
+# SharedPSD and SharedPoolSoapyPower override internals of soapypower (PSD.update_async, _release_future_memory,
+# psd_state['futures'], SoapyPower.setup signature and _psd) as they are in this release
+SOAPYPOWER_VERSION = '1.6.1'
+if soapypower_version != SOAPYPOWER_VERSION:
+    logger.warning('Shared PSD pool was written for soapypower {}, found {}'.format(SOAPYPOWER_VERSION,
+                                                                                   soapypower_version))
+
+
+class SharedPSD(psd.PSD):
+    """PSD computing Welch updates on a shared pool client instead of its own thread pool"""
+    def __init__(self, pool_client, *args, **kwargs):
+        # Own executor only waits for results, the FFT work goes to the shared pool
+        kwargs['max_threads'] = 1
+        super().__init__(*args, **kwargs)
+        self._pool_client = pool_client
+
+    def update_async(self, psd_state, samples_array):
+        future = self._pool_client.submit(self.update, psd_state, samples_array)
+        future.add_done_callback(self._release_future_memory)
+        psd_state['futures'].append(future)
+        return future
+
+
+class SharedPoolSoapyPower(power.SoapyPower):
+    """SoapyPower whose PSD work runs on a shared pool client"""
+    def __init__(self, pool_client, **kwargs):
+        super().__init__(**kwargs)
+        self._pool_client = pool_client
+
+    def setup(self, bins, repeats, base_buffer_size=0, max_buffer_size=0, fft_window='hann',
+              fft_overlap=0.5, crop_factor=0, log_scale=True, remove_dc=False, detrend=None,
+              lnb_lo=0, tune_delay=0, reset_stream=False, max_threads=0, max_queue_size=0):
+        super().setup(bins, repeats, base_buffer_size, max_buffer_size, fft_window=fft_window,
+                      fft_overlap=fft_overlap, crop_factor=crop_factor, log_scale=log_scale, remove_dc=remove_dc,
+                      detrend=detrend, lnb_lo=lnb_lo, tune_delay=tune_delay, reset_stream=reset_stream,
+                      max_threads=1, max_queue_size=max_queue_size)
+        self._psd = SharedPSD(self._pool_client, bins, self.device.sample_rate, fft_window=fft_window,
+                              fft_overlap=fft_overlap, crop_factor=crop_factor, log_scale=log_scale,
+                              remove_dc=remove_dc, detrend=detrend, lnb_lo=lnb_lo, max_queue_size=max_queue_size)
@@ -18,6 +18,8 @@ from soapypower.version import __version__
 import json
 import datetime
 import time
+from freq_plan import FreqPlan
+from products import CampaignProducts
 
 logger = logging.getLogger(__name__)
 re_float_with_multiplier = re.compile(r'(?P<num>[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)(?P<multi>[kMGT])?')
@@ -70,6 +72,27 @@ def device_settings(string):
     return settings
 
 
+def rolling_windows(string):
+    """Convert string with rolling windows NAME=SECONDS:INTERVALS to dict of (span, intervals)"""
+    if not string:
+        return {}
+
+    windows = {}
+    for window in string.split(','):
+        name, value = window.split('=')
+        span, intervals = value.split(':') if ':' in value else (value, 60)
+        windows[name.strip()] = (float_with_multiplier(span.strip()), int(intervals))
+    return windows
+
+
+def positive_int(string):
+    """Convert string to integer of at least 1"""
+    value = int(string)
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, got {}'.format(value))
+    return value
+
+
 def wrap(text, indent='    '):
     """Wrap text to terminal width with default indentation"""
     wrapper = textwrap.TextWrapper(
@@ -271,6 +294,8 @@ def setup_argument_parser():
                             help='maximum size of PSD work queue (-1 = unlimited, 0 = auto, default: %(default)s)')
     perf_title.add_argument('--no-pyfftw', action='store_true',
                             help='don\'t use pyfftw library even if it is available (use scipy.fftpack or numpy.fft)')
+    perf_title.add_argument('--float32', action='store_true',
+                            help='accumulate max/mean/min spectra in float32 to halve memory use on large bin counts')
 
     other_title = parser.add_argument_group('Other options')
     other_title.add_argument('-l', '--linear', action='store_true',
@@ -285,6 +310,71 @@ def setup_argument_parser():
                              help='shape parameter of window function (required for kaiser and tukey windows)')
     other_title.add_argument('--fft-overlap', metavar='PERCENT', type=float, default=50,
                              help='Welch\'s method overlap between segments (default: %(default)s)')
+    other_title.add_argument('--windows', metavar='STRING', type=rolling_windows, default='',
+                             help='rolling max/mean/min spectra over recent time windows, written as '
+                                  'magMax_NAME.txt etc. (example: 1h=3600:60,1d=86400:144 for NAME=SECONDS:INTERVALS)')
+
+    hist_title = parser.add_argument_group('Power histograms')
+    hist_title.add_argument('--hist-step', metavar='dB', type=float, default=0,
+                            help='histogram bin width for median and percentile spectra (0 = disabled, default: %(default)s)')
+    hist_title.add_argument('--hist-min', metavar='dB', type=float, default=-120,
+                            help='lower edge of histogram range (default: %(default)s)')
+    hist_title.add_argument('--hist-max', metavar='dB', type=float, default=0,
+                            help='upper edge of histogram range (default: %(default)s)')
+    hist_title.add_argument('--hist-every', metavar='NUM', type=positive_int, default=10,
+                            help='write percentile spectra and checkpoint every NUM sweeps (default: %(default)s)')
+    hist_title.add_argument('--hist-resume', action='store_true',
+                            help='continue accumulating from existing histogram.npz checkpoint')
+    hist_title.add_argument('--occupancy-threshold', metavar='dB', type=float, default=None,
+                            help='write fraction of sweeps at or above threshold per channel to occupancy.txt')
+
+    cal_title = parser.add_argument_group('Calibration')
+    cal_group = cal_title.add_mutually_exclusive_group()
+    cal_group.add_argument('--cal-build', metavar='NUM', type=int, default=0,
+                           help='build bandpass calibration from the first NUM sweeps, cache it and apply it to '
+                                'the following sweeps (incompatible with --cal-apply)')
+    cal_group.add_argument('--cal-apply', action='store_true',
+                           help='apply cached bandpass calibration matching device settings (incompatible with --cal-build)')
+    cal_title.add_argument('--cal-dir', metavar='PATH', default=os.getcwd()+'/calibration/',
+                           help='calibration cache directory (default: %(default)s)')
+
+    allan_title = parser.add_argument_group('Allan variance')
+    allan_title.add_argument('--allan-scales', metavar='NUM', type=int, default=0,
+                             help='number of octave spaced averaging times of 1, 2, 4, ... sweeps '
+                                  '(0 = disabled, default: %(default)s)')
+    allan_title.add_argument('--allan-bands', metavar='NUM', type=int, default=8,
+                             help='number of bands to report optimal integration time for (default: %(default)s)')
+    allan_title.add_argument('--allan-every', metavar='NUM', type=positive_int, default=10,
+                             help='write Allan variance products every NUM sweeps (default: %(default)s)')
+
+    env_title = parser.add_argument_group('Environment telemetry')
+    env_title.add_argument('--env-interval', metavar='SECONDS', type=float, default=0,
+                           help='temperature/humidity sampling interval (0 = disabled, default: %(default)s)')
+    env_title.add_argument('--env-sensor', metavar='NUM', type=int, default=11,
+                           help='DHT sensor type (default: %(default)s)')
+    env_title.add_argument('--env-pin', metavar='NUM', type=int, default=4,
+                           help='DHT sensor data pin (default: %(default)s)')
+    env_title.add_argument('--env-timeout', metavar='SECONDS', type=float, default=5,
+                           help='maximum time spent on a single sensor reading (default: %(default)s)')
+
+    postproc_title = parser.add_argument_group('Post-processing')
+    postproc_title.add_argument('--postproc-workers', metavar='NUM', type=int, default=0,
+                                help='number of post-processing worker processes (0 = disabled, default: %(default)s)')
+    postproc_title.add_argument('--postproc-slots', metavar='NUM', type=int, default=4,
+                                help='number of sweeps that can wait for post-processing (default: %(default)s)')
+    postproc_title.add_argument('--postproc-drop', action='store_true',
+                                help='drop sweeps from post-processing when all slots are busy instead of waiting')
+    postproc_title.add_argument('--postproc-products', action='store_true',
+                                help='update and write magFull, max/mean/min, calibrated, rolling window, histogram '
+                                     'and Allan variance products in a separate worker process instead of between '
+                                     'sweeps (uses --postproc-slots, never drops sweeps)')
+
+    stream_title = parser.add_argument_group('Streaming')
+    stream_title.add_argument('--publish', metavar='SOCKET', nargs='?', const='sweeps.sock', default=None,
+                              help='publish completed sweeps on a Unix domain socket, relative paths are within '
+                                   'the campaign directory (default socket: sweeps.sock)')
+    stream_title.add_argument('--publish-queue', metavar='NUM', type=int, default=4,
+                              help='sweeps queued per subscriber before dropping (default: %(default)s)')
 
     return parser
 
@@ -319,26 +409,32 @@ def write_dict_json(argsDict, filepath):
     with open(filepath, 'w') as fileID:
         fileID.write(json.dumps(argsDict, cls=JSONEncoder))   # Write config dict to json file using custom JSONencoder
 
-def isMonotonic(A):
-    """Check if given array is Monotonic"""
-    return (all(A[i] <= A[i + 1] for i in range(len(A) - 1)) or
-            all(A[i] >= A[i + 1] for i in range(len(A) - 1)))
-
-def lin10(dB):
-    """Convert dB = 10*log10(A) to linear and return A"""
-    return 10**(dB/10)
 def dB10(A):
     """Returns dB = 10*log10(A)"""
     return 10*np.log10(A)
 
+def write_env_row(envSampler, start_dtime, end_dtime, filepath, mode='a'):
+    """Write temperature and humidity interpolated to sweep start and end times"""
+    temperature, humidity = envSampler.interpolate([start_dtime.timestamp(), end_dtime.timestamp()])
+    with open(filepath, mode) as fileID:
+        fileID.write('{:.2f}, {:.2f}, {:.2f}, {:.2f}\n'.format(temperature[0], humidity[0],
+                                                              temperature[1], humidity[1]))
+
+def write_sweep_stats(results, filepath):
+    """Append per-sweep statistics returned by post-processing workers"""
+    if not results:
+        return
+    with open(filepath, 'a') as fileID:
+        for Nsweep, stats in results:
+            fileID.write('{}, {:.6f}, {:.6f}, {:.3f}, {:.6f}\n'.format(
+                Nsweep, stats['mean'], stats['max'], stats['freq_max'], stats['min']))
+
 def main():
     # Parse command line arguments
     parser = setup_argument_parser()
     args = parser.parse_args()
     # Define paths to campaign
     campaignPath = os.getcwd()+'/campaign/'
-    # Overide necessary args to acheive required campaign behaviour
-    output_fid = open(campaignPath+'output.txt', "w", encoding="utf-8")
    
     # Setup logging
     if args.quiet:
@@ -369,9 +465,27 @@ def main():
     if args.no_pyfftw:
         power.psd.simplespectral.use_pyfftw = False
 
+    run_campaign(args, campaignPath, error=parser.error)
+
+
+def run_campaign(args, campaignPath, error=None, sdr_class=None, on_sweep=None):
+    """Run campaign described by parsed args, writing its files to campaignPath
+
+    sdr_class creates the SoapyPower instance for each sweep (default: soapypower.power.SoapyPower)
+    and on_sweep(statusDict, bins, start_dtime, end_dtime) is called after every completed sweep.
+    """
+    from soapypower import power
+    if error is None:
+        def error(message):
+            raise RuntimeError(message)
+    if sdr_class is None:
+        sdr_class = power.SoapyPower
+    # Overide necessary args to acheive required campaign behaviour
+    output_fid = open(campaignPath+'output.txt', "w", encoding="utf-8")
+
     # Create SoapyPower instance
     try:
-        sdr = power.SoapyPower(
+        sdr = sdr_class(
             soapy_args=args.device, sample_rate=args.rate, bandwidth=args.bandwidth, corr=args.ppm,
             gain=args.specific_gains if args.specific_gains else args.gain, auto_gain=args.agc,
             channel=args.channel, antenna=args.antenna, settings=args.device_settings,
@@ -381,46 +495,63 @@ def main():
         )
         logger.info('Using device: {}'.format(sdr.device.hardware))
     except RuntimeError:
-        parser.error('No devices found!')
+        error('No devices found!')
 
-    # Prepare arguments for SoapyPower.sweep()
+    # Prepare arguments for SoapyPower.sweep(), reusing compiled frequency plan if arguments are unchanged
+    plan_fname = campaignPath+'plan.npz'
+    plan_key = FreqPlan.args_key(args, sdr.device.sample_rate)
+    plan = FreqPlan.load(plan_fname)
     if len(args.freq) < 2:
         args.freq = [args.freq[0], args.freq[0]]
+    unresolved = (args.bins, args.overlap, args.crop)
 
-    if args.bin_size:
-        args.bins = sdr.bin_size_to_bins(args.bin_size)
-    args.bins = sdr.nearest_bins(args.bins, even=args.even, pow2=args.pow2)
+    def resolve_plan(plan=None):
+        """Set sweep arguments from plan, or compile a new plan from the command line values if None"""
+        args.bins, args.overlap, args.crop = unresolved
+        if plan is not None:
+            plan.apply(args)
+        else:
+            if args.bin_size:
+                args.bins = sdr.bin_size_to_bins(args.bin_size)
+            args.bins = sdr.nearest_bins(args.bins, even=args.even, pow2=args.pow2)
 
-    if args.crop:
-        args.overlap = args.crop
-        args.crop = True
-    else:
-        args.crop = False
+            if args.crop:
+                args.overlap = args.crop
+                args.crop = True
+            else:
+                args.crop = False
 
-    if args.overlap:
-        args.overlap /= 100
-        args.overlap = sdr.nearest_overlap(args.overlap, args.bins)
+            if args.overlap:
+                args.overlap /= 100
+                args.overlap = sdr.nearest_overlap(args.overlap, args.bins)
 
-    if args.total_time:
-        args.time = args.total_time / len(sdr.freq_plan(args.freq[0], args.freq[1], args.bins, args.overlap, quiet=True))
-    if args.time:
-        args.repeats = sdr.time_to_repeats(args.bins, args.time)
+            plan = FreqPlan.compile(sdr, args, plan_key)
+
+        if args.total_time:
+            args.time = args.total_time / len(plan.hops)
+        if args.time:
+            args.repeats = sdr.time_to_repeats(args.bins, args.time)
+        return plan
+
+    planReused = plan is not None and plan.key == plan_key
+    if planReused:
+        plan = resolve_plan(plan)
+        logger.info('Reusing frequency plan {}'.format(plan.plan_id))
+    else:
+        plan = resolve_plan()
 
     if args.fft_window in ('kaiser', 'tukey'):
         if args.fft_window_param is None:
-            parser.error('argument --fft-window: --fft-window-param is required when using kaiser or tukey windows')
+            error('argument --fft-window: --fft-window-param is required when using kaiser or tukey windows')
         args.fft_window = (args.fft_window, args.fft_window_param)   
     
     # Define full file paths
     freq_fname = campaignPath+'freq.txt'
-    magFull_fname = campaignPath+'magFull.txt'
-    magMax_fname = campaignPath+'magMax.txt'
-    magMean_fname = campaignPath+'magMean.txt'
-    magMin_fname = campaignPath+'magMin.txt'
-    time_fname = campaignPath+'time.txt'
     status_fname = campaignPath+'status.txt'
     ctrl_fname = campaignPath+'ctrl.txt'
     settings_fname = campaignPath+'settings.txt'
+    env_fname = campaignPath+'env.txt'
+    sweepStats_fname = campaignPath+'sweepStats.txt'
     # Log scan configuration to file 
     write_args_json(args, settings_fname)
     # Set up dictionary to contain status variables
@@ -436,96 +567,155 @@ def main():
     write_dict_json(statusDict, status_fname)
     # Read in control file which can be manipulated by client
     ctrlDict = read_json(ctrl_fname)
-    # Start scan loop
-    while (statusDict['Nsweep']<args.runs or args.endless) and ctrlDict['run']==1:
-        output_fid = open(campaignPath+'output.txt', "w", encoding="utf-8")
-        # Recreate SoapyPower instance for each sweep. This avoids IO error 
-        # and allows changing arguments in between sweeps
-        try:
-            sdr = power.SoapyPower(
-                soapy_args=args.device, sample_rate=args.rate, bandwidth=args.bandwidth, corr=args.ppm,
-                gain=args.specific_gains if args.specific_gains else args.gain, auto_gain=args.agc,
-                channel=args.channel, antenna=args.antenna, settings=args.device_settings,
-                force_sample_rate=args.force_rate, force_bandwidth=args.force_bandwidth,
-                output=output_fid,
-                output_format=args.format
+    # Start sampling temperature and humidity in the background
+    if args.env_interval:
+        from env_sampler import EnvSampler
+        envSampler = EnvSampler(interval=args.env_interval, sensor=args.env_sensor,
+                                pin=args.env_pin, timeout=args.env_timeout)
+        envSampler.start()
+    else:
+        envSampler = None
+    postProc = None
+    # Accumulated products and their files, updated in the sweep loop or by a post-processing worker
+    products = CampaignProducts(args, campaignPath)
+    productStage = None
+    # Publish sweeps to local subscribers
+    if args.publish is not None:
+        from sweep_stream import SweepPublisher, settings_hash
+        publisher = SweepPublisher(os.path.join(campaignPath, args.publish), queue_size=args.publish_queue)
+        settingsHash = settings_hash(settings_fname)
+    else:
+        publisher = None
+    if args.postproc_workers:
+        open(sweepStats_fname, 'w').close()     # Results are appended in sweep order as they arrive
+    try:
+        # Start scan loop
+        while (statusDict['Nsweep']<args.runs or args.endless) and ctrlDict['run']==1:
+            output_fid = open(campaignPath+'output.txt', "w", encoding="utf-8")
+            # Recreate SoapyPower instance for each sweep. This avoids IO error 
+            # and allows changing arguments in between sweeps
+            try:
+                sdr = sdr_class(
+                    soapy_args=args.device, sample_rate=args.rate, bandwidth=args.bandwidth, corr=args.ppm,
+                    gain=args.specific_gains if args.specific_gains else args.gain, auto_gain=args.agc,
+                    channel=args.channel, antenna=args.antenna, settings=args.device_settings,
+                    force_sample_rate=args.force_rate, force_bandwidth=args.force_bandwidth,
+                    output=output_fid,
+                    output_format=args.format
+                )
+                logger.info('Using device: {}'.format(sdr.device.hardware))
+            except RuntimeError:
+                error('No devices found!')
+
+            print('\nStarting sweep number %s' % (statusDict['Nsweep']+1)+' ...\n')
+            scan_start_dtime = datetime.datetime.now()
+            # Start frequency sweep
+            sdr.sweep(
+                args.freq[0], args.freq[1], args.bins, repeats=args.repeats,
+                runs=1, overlap=args.overlap, crop=args.crop,
+                fft_window=args.fft_window, fft_overlap=args.fft_overlap / 100, log_scale=not args.linear,
+                remove_dc=args.remove_dc, detrend=args.detrend if args.detrend != 'none' else None,
+                lnb_lo=args.lnb_lo, tune_delay=args.tune_delay, reset_stream=args.reset_stream,
+                base_buffer_size=args.buffer_size, max_buffer_size=args.max_buffer_size,
+                max_threads=args.max_threads, max_queue_size=args.max_queue_size
             )
-            logger.info('Using device: {}'.format(sdr.device.hardware))
-        except RuntimeError:
-            parser.error('No devices found!')
-
-        print('\nStarting sweep number %s' % (statusDict['Nsweep']+1)+' ...\n')
-        scan_start_dtime = datetime.datetime.now()
-        # Start frequency sweep
-        sdr.sweep(
-            args.freq[0], args.freq[1], args.bins, repeats=args.repeats,
-            runs=1, overlap=args.overlap, crop=args.crop,
-            fft_window=args.fft_window, fft_overlap=args.fft_overlap / 100, log_scale=not args.linear,
-            remove_dc=args.remove_dc, detrend=args.detrend if args.detrend != 'none' else None,
-            lnb_lo=args.lnb_lo, tune_delay=args.tune_delay, reset_stream=args.reset_stream,
-            base_buffer_size=args.buffer_size, max_buffer_size=args.max_buffer_size,
-            max_threads=args.max_threads, max_queue_size=args.max_queue_size
-        )
-        scan_end_dtime = datetime.datetime.now()
-        scan_result = np.loadtxt(output_fid.name, dtype=float, comments='#', delimiter=' ')
-        freq = scan_result[:,0]
-        mag_dB = scan_result[:,1]
-        if statusDict['Nsweep']==0:    # Initialise output files if this is the first run
-            if all(i > 0 for i in freq) and isMonotonic(freq):      # Check if freq array is positive monotonic
-                freq_init = np.copy(freq) # make a copy and store as base freq vect
-                magMax_dB = np.copy(mag_dB) # Max and min spectrums initialized
-                magMin_dB = np.copy(mag_dB)
-                magMean_lin = lin10(mag_dB) # Save mean as linear for averaging
-                np.savetxt(freq_fname, freq.reshape(1,-1), fmt='%.3f') 
-                np.savetxt(magFull_fname, mag_dB.reshape(1,-1), fmt='%.6f')
-                np.savetxt(magMax_fname, mag_dB.reshape(1,-1), fmt='%.6f')
-                np.savetxt(magMean_fname, mag_dB.reshape(1,-1), fmt='%.6f')
-                np.savetxt(magMin_fname, mag_dB.reshape(1,-1), fmt='%.6f')
-                with open(time_fname,'w') as fileID:
-                    fileID.write('{}, {}\n'.format(scan_start_dtime,scan_end_dtime))
+            scan_end_dtime = datetime.datetime.now()
+            scan_result = np.loadtxt(output_fid.name, dtype=float, comments='#', delimiter=' ')
+            freq = scan_result[:,0]
+            mag_dB = scan_result[:,1]
+            if statusDict['Nsweep']==0 and planReused and not plan.bind(freq):
+                # Saved plan does not describe what the receiver produces, recompile it and repeat the sweep
+                logger.warning('Frequency plan {} in {} does not match first sweep, recompiling'.format(
+                    plan.plan_id, plan_fname))
+                plan = resolve_plan()
+                planReused = False
+                continue
+            if statusDict['Nsweep']==0:    # Initialise output files if this is the first run
+                if plan.bind(freq):      # Check if freq array is positive monotonic and matches the plan
+                    plan.save(plan_fname)
+                    if publisher:
+                        publisher.publish_plan(freq, settingsHash)
+                    np.savetxt(freq_fname, freq.reshape(1,-1), fmt='%.3f') 
+                    if envSampler:
+                        write_env_row(envSampler, scan_start_dtime, scan_end_dtime, env_fname, 'w')
+                else:
+                    raise ValueError('Initial scan frequency vector is invalid!')
+            elif plan.check(freq, debug=args.debug):    # Check current frequency vector against plan (fully in debug mode)
+                if envSampler:
+                    write_env_row(envSampler, scan_start_dtime, scan_end_dtime, env_fname, 'a')
             else:
-                raise ValueError('Initial scan frequency vector is invalid!')
-        elif all(freq==freq_init):    # Check if current frequency vector is identical to initial
-            # Calculate max, mean and min amplitudes
-            magMean_lin=(magMean_lin+lin10(mag_dB))/(statusDict['Nsweep']+1)
-            magMax_dB[np.where(mag_dB>magMax_dB)] = mag_dB[np.where(mag_dB>magMax_dB)]
-            magMin_dB[np.where(mag_dB<magMin_dB)] = mag_dB[np.where(mag_dB<magMin_dB)]
-            # Save to data files
-            np.savetxt(magMax_fname, magMax_dB.reshape(1,-1), fmt='%.6f')
-            np.savetxt(magMin_fname, mag_dB.reshape(1,-1), fmt='%.6f')
-            np.savetxt(magMean_fname, dB10(magMean_lin.reshape(1,-1)), fmt='%.6f')
-            with open(magFull_fname, "a") as fileID:    # Append scan to full magnitude data file
-                np.savetxt(fileID, mag_dB.reshape(1,-1), fmt='%.6f')
-            with open(time_fname,'a') as fileID:
-                fileID.write('{}, {}\n'.format(scan_start_dtime,scan_end_dtime))
-        else:
-            raise ValueError('Scan ' + str(statusDict['Nsweep']) + ' frequency vector does not match initial!')
-        
-        # Update status
-        statusDict['Nsweep']=statusDict['Nsweep']+1
-        statusDict['curr_time']=datetime.datetime.now()
-        print('\nSweep %s' % statusDict['Nsweep'] + ' complete.')
-        write_dict_json(statusDict, status_fname)
-        
-        # Read in control file to decide what to do next
-        ctrlDict = read_json(ctrl_fname)
-        if ctrlDict['pause']:
-            statusDict['paused']=1
+                raise ValueError('Scan ' + str(statusDict['Nsweep']) + ' frequency vector does not match initial!')
+
+            # Update accumulated products and write them to the campaign files, in a worker process if requested
+            if args.postproc_products:
+                if productStage is None:
+                    from postproc import PostProcessor
+                    productStage = PostProcessor(len(freq), task=products, constants={'freq': freq}, workers=1,
+                                                 slots=args.postproc_slots, policy='block')
+                productStage.submit(statusDict['Nsweep'], info={'start': scan_start_dtime, 'end': scan_end_dtime},
+                                    mag_dB=mag_dB)
+                productStage.results()
+                if productStage.failed or productStage.errors:
+                    raise RuntimeError('Updating campaign products failed in post-processing worker!')
+                statusDict['products_queue'] = productStage.queue_depth()
+            else:
+                products(statusDict['Nsweep'], freq, mag_dB, scan_start_dtime, scan_end_dtime)
+
+            if publisher:    # Published Nsweep is the 0-based sweep index, status.txt counts completed sweeps
+                publisher.publish(statusDict['Nsweep'], mag_dB, scan_start_dtime, scan_end_dtime, settingsHash)
+
+            # Hand sweep to post-processing workers and write out any results that are ready
+            if args.postproc_workers:
+                if postProc is None:
+                    from postproc import PostProcessor
+                    postProc = PostProcessor(len(freq), constants={'freq': freq}, workers=args.postproc_workers,
+                                             slots=args.postproc_slots, policy='drop' if args.postproc_drop else 'block')
+                postProc.submit(statusDict['Nsweep'], mag_dB=mag_dB)
+                write_sweep_stats(postProc.results(), sweepStats_fname)
+                statusDict['postproc_dropped'] = postProc.dropped
+                statusDict['postproc_queue'] = postProc.queue_depth()
+
+            # Update status
+            statusDict['Nsweep']=statusDict['Nsweep']+1
+            statusDict['curr_time']=datetime.datetime.now()
+            print('\nSweep %s' % statusDict['Nsweep'] + ' complete.')
             write_dict_json(statusDict, status_fname)
-            while ctrlDict['pause']:
-                time.sleep(30)
-                ctrlDict = read_json(ctrl_fname)
-            statusDict['paused']=0
-            write_dict_json(statusDict, status_fname)         
-        if ctrlDict['run']==0:
-            statusDict['extFlag']=0
-        elif not args.endless and statusDict['Nsweep']==args.runs:
-            statusDict['extFlag']=statusDict['Nsweep']
+            if on_sweep:
+                on_sweep(statusDict, len(freq), scan_start_dtime, scan_end_dtime)
+        
+            # Read in control file to decide what to do next
+            ctrlDict = read_json(ctrl_fname)
+            if ctrlDict['pause']:
+                statusDict['paused']=1
+                write_dict_json(statusDict, status_fname)
+                while ctrlDict['pause']:
+                    time.sleep(30)
+                    ctrlDict = read_json(ctrl_fname)
+                statusDict['paused']=0
+                write_dict_json(statusDict, status_fname)         
+            if ctrlDict['run']==0:
+                statusDict['extFlag']=0
+            elif not args.endless and statusDict['Nsweep']==args.runs:
+                statusDict['extFlag']=statusDict['Nsweep']
             
-        write_dict_json(statusDict, status_fname)
-    
+            write_dict_json(statusDict, status_fname)
+    finally:
+        # Stop background workers and release shared memory and sockets, also if the sweep loop failed
+        if postProc:
+            write_sweep_stats(postProc.close(), sweepStats_fname)
+            statusDict['postproc_queue'] = 0
+        if productStage:
+            # Worker writes the final products when closed, which may take a while on large scans
+            productStage.close(timeout=None)
+            statusDict['products_queue'] = 0
+        if envSampler:
+            envSampler.stop()
+        if publisher:
+            publisher.close()
     statusDict['running']=0
     write_dict_json(statusDict, status_fname)
+    if not productStage:
+        products.close()
     
     
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Run several campaigns (e.g. both SKAAP receivers) in one process. Each campaign has its own
+                directory, device and run_campaign.py arguments, and all of them share one bounded PSD
+                worker pool with round-robin scheduling. Per-campaign throughput and PSD queue depth are
+                logged and written to multi_status.txt.
+
+                Usage: run_multi.py multi.json
+                multi.json:
+                {"max_threads": 4, "max_queue_size": 0, "report_interval": 60,
+                 "campaigns": [{"name": "pol0", "path": "campaign_pol0/", "args": "-d device_id=0 -f 70M:1G -c"},
+                               {"name": "pol1", "path": "campaign_pol1/", "args": "-d device_id=1 -f 70M:1G -c"}]}
+"""
+
+import os, sys, json, time, shlex, logging, argparse, datetime, threading, functools
+
+from run_campaign import setup_argument_parser, run_campaign, write_dict_json
+from fair_pool import FairPool
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignStats:
+    """Throughput counters of one campaign, updated from its sweep loop"""
+    def __init__(self, name, pool_client):
+        self.name = name
+        self.pool_client = pool_client
+        self.Nsweep = 0
+        self.bins = 0
+        self.sweep_time = 0.0
+        self.start_time = time.time()
+        self.state = 'starting'
+
+    def on_sweep(self, statusDict, bins, start_dtime, end_dtime):
+        self.Nsweep = statusDict['Nsweep']
+        self.bins = bins
+        self.sweep_time += (end_dtime - start_dtime).total_seconds()
+        self.state = 'running'
+
+    def report(self):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        return {'state': self.state,
+                'Nsweep': self.Nsweep,
+                'sweeps_per_hour': 3600 * self.Nsweep / elapsed,
+                'bins_per_second': self.Nsweep * self.bins / elapsed,
+                'mean_sweep_time': self.sweep_time / self.Nsweep if self.Nsweep else 0,
+                'psd_queue': self.pool_client.queue_depth(),
+                'psd_queue_max': self.pool_client.max_queue_size_reached,
+                'psd_completed': self.pool_client.completed,
+                'psd_busy_time': self.pool_client.busy_time}
+
+
+def run_one(campaign, stats, pool_client):
+    """Thread target running a single campaign"""
+    from psd_pool import SharedPoolSoapyPower
+    campaignPath = os.path.join(campaign['path'], '')
+    args = setup_argument_parser().parse_args(shlex.split(campaign['args']) if isinstance(campaign['args'], str)
+                                              else campaign['args'])
+    try:
+        run_campaign(args, campaignPath, sdr_class=functools.partial(SharedPoolSoapyPower, pool_client),
+                     on_sweep=stats.on_sweep)
+        stats.state = 'finished'
+    except Exception:
+        logger.exception('Campaign {} failed'.format(campaign['name']))
+        stats.state = 'failed'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several campaigns sharing one PSD worker pool')
+    parser.add_argument('config', help='JSON file describing campaigns')
+    parser.add_argument('-q', '--quiet', action='store_true', help='limit verbosity')
+    parser.add_argument('--debug', action='store_true', help='detailed debugging messages')
+    opts = parser.parse_args()
+
+    if opts.quiet:
+        log_level = logging.WARNING
+    elif opts.debug:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+    logging.basicConfig(
+        level=log_level,
+        format='%(threadName)s %(levelname)s: %(message)s'
+    )
+    with open(opts.config, 'r') as fileID:
+        config = json.load(fileID)
+    pool = FairPool(config.get('max_threads', 0), config.get('max_queue_size', 0))
+    logger.info('Shared PSD pool: {} threads, queue size {} per campaign'.format(pool.max_workers,
+                                                                                pool.max_queue_size))
+    campaigns = config['campaigns']
+    names = [c.setdefault('name', os.path.basename(os.path.normpath(c['path']))) for c in campaigns]
+    if len(set(names)) != len(names) or len(set(os.path.abspath(c['path']) for c in campaigns)) != len(campaigns):
+        parser.error('Campaign names and paths must be unique!')
+
+    allStats = {}
+    threads = []
+    for campaign in campaigns:
+        os.makedirs(campaign['path'], exist_ok=True)
+        ctrl_fname = os.path.join(campaign['path'], 'ctrl.txt')
+        if not os.path.exists(ctrl_fname):
+            write_dict_json({'run': 1, 'pause': 0}, ctrl_fname)
+        pool_client = pool.client(campaign['name'])
+        allStats[campaign['name']] = CampaignStats(campaign['name'], pool_client)
+        t = threading.Thread(target=run_one, name=campaign['name'],
+                             args=(campaign, allStats[campaign['name']], pool_client))
+        t.start()
+        threads.append(t)
+
+    # Report throughput and queue depth until all campaigns have finished
+    report_interval = config.get('report_interval', 60)
+    status_fname = os.path.join(os.path.dirname(os.path.abspath(opts.config)), 'multi_status.txt')
+    while True:
+        for t in threads:
+            t.join(report_interval / len(threads))
+        statusDict = {'curr_time': datetime.datetime.now(), 'PID': os.getpid(),
+                      'psd_threads': pool.max_workers,
+                      'campaigns': {name: stats.report() for name, stats in allStats.items()}}
+        write_dict_json(statusDict, status_fname)
+        for name, report in statusDict['campaigns'].items():
+            logger.info('{}: {} sweeps, {:.1f} sweeps/h, {:.0f} bins/s, PSD queue {} (max {})'.format(
+                name, report['Nsweep'], report['sweeps_per_hour'], report['bins_per_second'],
+                report['psd_queue'], report['psd_queue_max']))
+        if not any(t.is_alive() for t in threads):
+            break
+    pool.shutdown()
+    sys.exit(0 if all(stats.state == 'finished' for stats in allStats.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:    Publish completed sweeps to local subscribers (live plotter, archiver, RFI monitor) over a
+                Unix domain socket so they get new data without polling status.txt or touching disk.
+                Each subscriber has its own bounded queue and sender thread. When a subscriber falls
+                behind its sweeps are dropped, and it is disconnected if it keeps falling behind, so the
+                sweep loop is never blocked.
+
+                Message: struct '<4sII' (magic, header length, payload length), JSON header, payload
+                  'plan' message on connect: header {bins, settings_hash}, payload float64 frequencies
+                  'sweep' message per sweep: header {Nsweep, start, end, settings_hash, bins}, payload float32 dB
+                  Nsweep is the 0-based index of the sweep as in sweepStats.txt, one less than the number of
+                  completed sweeps in status.txt once the sweep is done
+
+                Usage: sweep_stream.py [socket path]   (prints headers of received sweeps)
+"""
+
+import os, sys, json, queue, socket, struct, hashlib, logging, threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+MAGIC = b'SKSW'
+PREFIX = struct.Struct('<4sII')
+
+
+def settings_hash(filepath):
+    """Short hash of settings file used to tie sweeps to the campaign configuration"""
+    with open(filepath, 'rb') as fileID:
+        return hashlib.sha1(fileID.read()).hexdigest()[:16]
+
+
+def encode_message(header, payload=b''):
+    """Frame JSON header and raw payload into a single message"""
+    header = json.dumps(header).encode()
+    return PREFIX.pack(MAGIC, len(header), len(payload)) + header + payload
+
+
+class _Subscriber:
+    """Connected client with a bounded queue of encoded messages and its own sender thread"""
+    def __init__(self, conn, queue_size, max_drops, on_close):
+        self.conn = conn
+        self.queue = queue.Queue(queue_size)
+        self.max_drops = max_drops
+        self.dropped = 0
+        self.consecutive_drops = 0
+        self.closed = False
+        self._on_close = on_close
+        self._thread = threading.Thread(target=self._send_loop, name='SweepStream_sender', daemon=True)
+        self._thread.start()
+
+    def offer(self, message):
+        """Queue message without blocking. Returns False if the subscriber should be disconnected"""
+        try:
+            self.queue.put_nowait(message)
+            self.consecutive_drops = 0
+        except queue.Full:
+            self.dropped += 1
+            self.consecutive_drops += 1
+            if self.max_drops and self.consecutive_drops >= self.max_drops:
+                return False
+        return True
+
+    def _send_loop(self):
+        try:
+            while True:
+                message = self.queue.get()
+                if message is None:
+                    break
+                self.conn.sendall(message)
+        except OSError:
+            pass
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+        self._on_close(self)
+
+
+class SweepPublisher:
+    """Unix domain socket server publishing each completed sweep to all connected subscribers"""
+    def __init__(self, path, queue_size=4, max_drops=100):
+        self.path = path
+        self._queue_size = queue_size
+        self._max_drops = max_drops
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._plan = None
+        self.published = 0
+        if os.path.exists(path):
+            os.unlink(path)     # Left behind by a previous campaign
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        self._thread = threading.Thread(target=self._accept_loop, name='SweepStream_accept', daemon=True)
+        self._thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            subscriber = _Subscriber(conn, self._queue_size, self._max_drops, self._remove)
+            with self._lock:
+                if self._plan is not None:
+                    subscriber.offer(self._plan)
+                self._subscribers.append(subscriber)
+            logger.info('Sweep subscriber connected ({} total)'.format(len(self._subscribers)))
+
+    def _remove(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+        if subscriber.dropped:
+            logger.info('Sweep subscriber disconnected after {} dropped sweeps'.format(subscriber.dropped))
+
+    def publish_plan(self, freq, settings_hash=''):
+        """Set frequency plan sent to every subscriber when it connects"""
+        plan = encode_message({'type': 'plan', 'bins': len(freq), 'settings_hash': settings_hash},
+                              np.asarray(freq, dtype='<f8').tobytes())
+        with self._lock:
+            self._plan = plan
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(plan)
+
+    def publish(self, Nsweep, mag_dB, start_dtime, end_dtime, settings_hash=''):
+        """Queue sweep for all subscribers without blocking, dropping it for those that are behind"""
+        message = encode_message({'type': 'sweep', 'Nsweep': Nsweep, 'start': str(start_dtime),
+                                  'end': str(end_dtime), 'settings_hash': settings_hash, 'bins': len(mag_dB)},
+                                 np.asarray(mag_dB, dtype='<f4').tobytes())
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if not subscriber.offer(message):
+                logger.warning('Disconnecting sweep subscriber after {} consecutive drops'.format(
+                    subscriber.consecutive_drops))
+                subscriber.close()
+        self.published += 1
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def close(self):
+        """Stop accepting subscribers, disconnect all and remove socket file"""
+        self._server.close()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class SweepSubscriber:
+    """Client for SweepPublisher. Iterating yields (header, array) for each received message"""
+    def __init__(self, path):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self.freq = None
+
+    def _recv_exact(self, n):
+        buf = bytearray(n)
+        view = memoryview(buf)
+        while n:
+            received = self._sock.recv_into(view, n)
+            if not received:
+                raise EOFError('Publisher closed connection')
+            view = view[received:]
+            n -= received
+        return buf
+
+    def receive(self):
+        """Block until the next message and return (header, array)"""
+        magic, header_len, payload_len = PREFIX.unpack(self._recv_exact(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError('Corrupted sweep stream!')
+        header = json.loads(self._recv_exact(header_len))
+        payload = self._recv_exact(payload_len)
+        if header['type'] == 'plan':
+            self.freq = np.frombuffer(payload, dtype='<f8')
+            return header, self.freq
+        return header, np.frombuffer(payload, dtype='<f4')
+
+    def __iter__(self):
+        try:
+            while True:
+                yield self.receive()
+        except EOFError:
+            return
+
+    def close(self):
+        self._sock.close()
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()+'/campaign/sweeps.sock'
+    subscriber = SweepSubscriber(path)
+    for header, data in subscriber:
+        if header['type'] == 'plan':
+            print('Plan: {} bins, {:.3f} - {:.3f} MHz'.format(header['bins'], data[0] / 1e6, data[-1] / 1e6))
+        else:
+            print('Sweep {}: {} - {}, max {:.2f} dB'.format(header['Nsweep'], header['start'], header['end'],
+                                                          np.max(data)))
+    subscriber.close()
+
+
+if __name__ == '__main__':
+    main()
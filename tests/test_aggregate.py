@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from aggregate import SpectrumAggregator, RollingWindow
+
+
+def test_spectrum_aggregator_matches_direct():
+    rng = np.random.default_rng(1)
+    mag_dB = rng.normal(-80, 3, (20, 64))
+    aggregator = SpectrumAggregator(64)
+    for row in mag_dB:
+        aggregator.update(row)
+    np.testing.assert_allclose(aggregator.magMax_dB, mag_dB.max(axis=0))
+    np.testing.assert_allclose(aggregator.magMin_dB, mag_dB.min(axis=0))
+    np.testing.assert_allclose(aggregator.magMean_dB(), 10*np.log10(np.mean(10**(mag_dB/10), axis=0)))
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_rolling_window_matches_direct(dtype):
+    rng = np.random.default_rng(2)
+    span, intervals, bins = 60.0, 6, 32
+    window = RollingWindow(bins, span, intervals, dtype)
+    # Irregular sweep times with a gap longer than the window, and a strong burst that later expires
+    times = np.concatenate([np.cumsum(rng.uniform(1, 7, 40)), 400 + np.cumsum(rng.uniform(1, 7, 30))])
+    mag_dB = rng.normal(-80, 3, (len(times), bins))
+    mag_dB[5] += 60
+    tol = 1e-9 if dtype == np.float64 else 1e-4
+    for i, t in enumerate(times):
+        window.update(t, mag_dB[i])
+        # Window covers the intervals in (latest - intervals, latest]
+        latest = int(t // window.interval)
+        idx = (times[:i + 1] // window.interval).astype(int)
+        rows = mag_dB[:i + 1][idx > latest - intervals]
+        magMax_dB, magMean_dB, magMin_dB = window.products()
+        np.testing.assert_allclose(magMax_dB, rows.max(axis=0), rtol=tol)
+        np.testing.assert_allclose(magMin_dB, rows.min(axis=0), rtol=tol)
+        np.testing.assert_allclose(magMean_dB, 10*np.log10(np.mean(10**(rows/10), axis=0)), rtol=tol)
+
+
+def test_rolling_window_late_sweeps():
+    rng = np.random.default_rng(10)
+    window = RollingWindow(8, 60.0, 6)
+    # Sweeps arriving out of order, including into an interval that was never opened
+    times = np.array([5.0, 25.0, 55.0, 15.0, 41.0, 33.0, 61.0, 12.0, 70.0])
+    mag_dB = rng.normal(-80, 3, (len(times), 8))
+    for i, t in enumerate(times):
+        window.update(t, mag_dB[i])
+        latest = int(times[:i + 1].max() // window.interval)
+        idx = (times[:i + 1] // window.interval).astype(int)
+        rows = mag_dB[:i + 1][idx > latest - 6]
+        magMax_dB, magMean_dB, magMin_dB = window.products()
+        np.testing.assert_allclose(magMax_dB, rows.max(axis=0))
+        np.testing.assert_allclose(magMin_dB, rows.min(axis=0))
+        np.testing.assert_allclose(magMean_dB, 10*np.log10(np.mean(10**(rows/10), axis=0)))
+
+
+def test_rolling_window_expires_by_timestamp():
+    window = RollingWindow(4, 60.0, 6)
+    assert window.products() is None
+    window.update(5.0, np.full(4, -50.0))
+    window.update(35.0, np.full(4, -70.0))
+    np.testing.assert_allclose(window.products(50.0)[0], -50.0)
+    np.testing.assert_allclose(window.products(65.0)[0], -70.0)
+    assert window.products(200.0) is None
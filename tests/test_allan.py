@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from allan import AllanVariance
+
+
+def direct_avar(y, k):
+    """Non-overlapping Allan variance at averaging time of 2**k sweeps from explicit block means"""
+    m = 2**k
+    blocks = len(y) // m
+    means = y[:blocks*m].reshape(blocks, m, -1).mean(axis=1)
+    return 0.5 * np.mean(np.square(np.diff(means, axis=0)), axis=0)
+
+
+def drifting_noise(rng, sweeps, bins, drift):
+    """Linear power with white noise and a random walk of step size drift per channel"""
+    walk = np.cumsum(rng.normal(0, drift, (sweeps, bins)), axis=0)
+    return 100 + rng.normal(0, 1, (sweeps, bins)) + walk
+
+
+@pytest.mark.parametrize('sweeps', [1000, 1024, 37])
+def test_avar_matches_block_means(sweeps):
+    rng = np.random.default_rng(5)
+    y = drifting_noise(rng, sweeps, 16, 0.05)
+    allan = AllanVariance(16, scales=8)
+    for row in y:
+        allan.update(row)
+    avar = allan.avar()
+    for k in range(8):
+        blocks = sweeps // 2**k
+        assert allan.counts()[k] == max(blocks - 1, 0)
+        if blocks >= 2:
+            np.testing.assert_allclose(avar[k], direct_avar(y, k), rtol=1e-10)
+        else:
+            assert np.all(np.isnan(avar[k]))
+    np.testing.assert_allclose(allan.mean(), y.mean(axis=0))
+
+
+def test_optimal_tau_drift_limited():
+    rng = np.random.default_rng(6)
+    y = drifting_noise(rng, 1024, 64, 0.2)
+    allan = AllanVariance(64, scales=8)
+    for row in y:
+        allan.update(row)
+    (band, tau, avar, drift_limited), = allan.optimal_tau(2.0, bands=1)
+    assert band == slice(0, 64)
+    assert drift_limited
+    # Minimum where white noise averaging down (1/m) meets the random walk growing (~m drift**2 / 3)
+    assert 2.0 <= tau <= 2.0 * 8
+    expected = min(np.median(direct_avar(y, k) / np.square(y.mean(axis=0))) for k in range(8))
+    assert avar == pytest.approx(expected)
+
+
+def test_optimal_tau_white_noise_not_drift_limited():
+    rng = np.random.default_rng(7)
+    y = drifting_noise(rng, 1024, 64, 0.0)
+    allan = AllanVariance(64, scales=8)
+    for row in y:
+        allan.update(row)
+    results = allan.optimal_tau(1.0, bands=4)
+    assert len(results) == 4
+    for band, tau, avar, drift_limited in results:
+        assert not drift_limited
+        assert tau == 2**7
+
+
+def test_optimal_tau_without_usable_scales():
+    allan = AllanVariance(4, scales=4)
+    allan.update(np.ones(4))
+    (band, tau, avar, drift_limited), = allan.optimal_tau(1.0)
+    assert np.isnan(tau) and np.isnan(avar) and not drift_limited
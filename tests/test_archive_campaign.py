@@ -0,0 +1,89 @@
+import os
+import json
+import datetime
+
+import numpy as np
+import pytest
+
+from archive_campaign import CampaignArchive, pack_campaign, verify_archive, quantize_chunk
+
+
+def write_campaign(path, rows=23, bins=40, linear=False):
+    """Campaign directory with rows sweeps of bins channels, one sweep every 10 s"""
+    os.makedirs(path)
+    rng = np.random.default_rng(9)
+    freq = np.linspace(100e6, 102e6, bins)
+    mag_dB = rng.normal(-80, 5, (rows, bins))
+    np.savetxt(os.path.join(path, 'freq.txt'), freq.reshape(1, -1), fmt='%.3f')
+    if linear:
+        np.savetxt(os.path.join(path, 'magFull.txt'), 10**(mag_dB/10), fmt='%.6e')
+    else:
+        np.savetxt(os.path.join(path, 'magFull.txt'), mag_dB, fmt='%.6f')
+    t0 = datetime.datetime(2024, 1, 1)
+    with open(os.path.join(path, 'time.txt'), 'w') as fileID:
+        for i in range(rows):
+            start = t0 + datetime.timedelta(seconds=10*i)
+            fileID.write('{}, {}\n'.format(start, start + datetime.timedelta(seconds=8)))
+    with open(os.path.join(path, 'settings.txt'), 'w') as fileID:
+        json.dump({'linear': linear}, fileID)
+    return np.loadtxt(os.path.join(path, 'magFull.txt'), ndmin=2)
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_round_trip_within_tolerance(tmp_path, codec):
+    campaign, copy, fname = str(tmp_path / 'campaign'), str(tmp_path / 'copy'), str(tmp_path / 'c.skar')
+    mag_dB = write_campaign(campaign)
+    pack_campaign(campaign, fname, resolution=0.01, chunk_rows=5, codec=codec)
+    archive = CampaignArchive(fname)
+    try:
+        assert archive.rows == 23 and len(archive.index['chunks']) == 5    # Last chunk holds 3 rows
+        assert verify_archive(campaign, archive) <= 0.005 + 1e-9
+        # Rows spanning chunk boundaries and the partial last chunk
+        np.testing.assert_allclose(archive.read_rows(3, 21), mag_dB[3:21], atol=0.005 + 1e-9)
+        np.testing.assert_allclose(archive.read_rows(20), mag_dB[20:], atol=0.005 + 1e-9)
+        assert archive.read_rows(-5, 3).shape == (3, 40)
+        assert archive.read_rows(30).shape == (0, 40)
+        rows, data = archive.read_time_range(datetime.datetime(2024, 1, 1, 0, 0, 45),
+                                             datetime.datetime(2024, 1, 1, 0, 1, 55))
+        np.testing.assert_array_equal(rows, np.arange(5, 12))
+        np.testing.assert_allclose(data, mag_dB[5:12], atol=0.005 + 1e-9)
+        archive.unpack(copy)
+    finally:
+        archive.close()
+    np.testing.assert_allclose(np.loadtxt(os.path.join(copy, 'magFull.txt')), mag_dB, atol=0.005 + 1e-9)
+    np.testing.assert_array_equal(np.loadtxt(os.path.join(copy, 'freq.txt')),
+                                  np.loadtxt(os.path.join(campaign, 'freq.txt')))
+    for fname in ('time.txt', 'settings.txt'):
+        with open(os.path.join(campaign, fname), 'rb') as a, open(os.path.join(copy, fname), 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_linear_campaign_is_archived_in_dB(tmp_path):
+    campaign, copy, fname = str(tmp_path / 'campaign'), str(tmp_path / 'copy'), str(tmp_path / 'c.skar')
+    mag_lin = write_campaign(campaign, linear=True)
+    pack_campaign(campaign, fname, resolution=0.01, chunk_rows=8)
+    archive = CampaignArchive(fname)
+    try:
+        assert archive.linear
+        assert verify_archive(campaign, archive) <= 0.005 + 1e-6
+        np.testing.assert_allclose(archive.read_rows(), 10*np.log10(mag_lin), atol=0.005 + 1e-6)
+        archive.unpack(copy)
+    finally:
+        archive.close()
+    # Half a quantization step of 0.01 dB is 0.12 % in linear power
+    np.testing.assert_allclose(np.loadtxt(os.path.join(copy, 'magFull.txt')), mag_lin, rtol=1.2e-3)
+
+
+def test_linear_campaign_with_zero_power_is_refused(tmp_path):
+    campaign = str(tmp_path / 'campaign')
+    write_campaign(campaign, linear=True)
+    with open(os.path.join(campaign, 'magFull.txt'), 'a') as fileID:
+        fileID.write(' '.join(['0.000000']*40) + '\n')
+    with pytest.raises(ValueError):
+        pack_campaign(campaign, str(tmp_path / 'c.skar'))
+
+
+def test_resolution_too_small_for_int32():
+    with pytest.raises(ValueError):
+        quantize_chunk(np.full((1, 4), -80.0), 1e-8)
+    quantize_chunk(np.full((1, 4), -80.0), 1e-6)
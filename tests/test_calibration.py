@@ -0,0 +1,98 @@
+import logging
+
+import numpy as np
+import pytest
+
+from calibration import CalibrationCache, Calibrator, build_correction, cal_key, fold_correction
+from freq_plan import FreqPlan
+
+
+RATE = 2.4e6
+
+
+def plan(start, hops=4, bins=64, overlap=0.25):
+    step = RATE * (1 - overlap)
+    return FreqPlan('key', bins, overlap, True, RATE, 0.0, start + step*np.arange(hops))
+
+
+def ripple_dB(offset):
+    """Bandpass ripple of the receiver, a function of baseband offset only"""
+    return 3*np.cos(2*np.pi*offset/RATE*3)
+
+
+def test_build_correction_flattens_bandpass():
+    rng = np.random.default_rng(5)
+    bandpass_dB = -80 + ripple_dB(plan(100e6).offsets())
+    mag_dB = bandpass_dB + rng.normal(0, 0.1, (50, len(bandpass_dB)))
+    correction_dB = build_correction(mag_dB)
+    flat = mag_dB.mean(axis=0) + correction_dB
+    assert np.ptp(flat) < 0.2
+    assert np.median(flat) == pytest.approx(np.median(mag_dB.mean(axis=0)), abs=0.05)
+
+
+def test_cal_key():
+    freq = plan(100e6).freq
+    key = cal_key(freq, {'LNA': 20, 'VGA': 10}, RATE, 64)
+    assert key == cal_key(freq.copy(), {'VGA': 10, 'LNA': 20}, RATE, 64)
+    assert len({key, cal_key(freq, 30, RATE, 64), cal_key(freq, {'LNA': 20, 'VGA': 10}, 2e6, 64),
+                cal_key(freq, {'LNA': 20, 'VGA': 10}, RATE, 128),
+                cal_key(freq + 1e3, {'LNA': 20, 'VGA': 10}, RATE, 64)}) == 5
+
+
+def test_fold_correction_averages_hops():
+    p = plan(100e6)
+    offset, correction_dB = fold_correction(p.offsets(), -ripple_dB(p.offsets()))
+    assert len(offset) == p.channels_per_hop
+    assert np.all(np.diff(offset) > 0)
+    np.testing.assert_allclose(correction_dB, -ripple_dB(offset), atol=1e-9)
+
+
+def test_lookup_same_plan(tmp_path):
+    p = plan(100e6)
+    cache = CalibrationCache(str(tmp_path))
+    correction_dB = np.linspace(-1, 1, p.channels)
+    key = cache.save(p.freq, correction_dB, 37.2, RATE, 64, 10)
+    assert key == cal_key(p.freq, 37.2, RATE, 64)
+    np.testing.assert_array_equal(CalibrationCache(str(tmp_path)).lookup(p.freq, 37.2, RATE, 64), correction_dB)
+    assert cache.lookup(p.freq, 20, RATE, 64) is None
+
+
+def test_lookup_follows_hops_of_shifted_plan(tmp_path):
+    ref = plan(100e6)
+    cache = CalibrationCache(str(tmp_path))
+    cache.save(ref.freq, build_correction(-80 + ripple_dB(ref.offsets())), 37.2, RATE, 64, 10, ref.offsets())
+    # Half a hop further on, the ripple is at the same baseband offsets but different RF frequencies
+    shifted = plan(100e6 + RATE*0.75/2)
+    correction_dB = cache.lookup(shifted.freq, 37.2, RATE, 64, shifted.offsets())
+    flat = -80 + ripple_dB(shifted.offsets()) + correction_dB
+    assert np.ptp(flat) < 1e-6
+    # Without offsets only the reference plan itself can be calibrated
+    assert cache.lookup(shifted.freq, 37.2, RATE, 64) is None
+
+
+def test_lookup_warns_for_channels_outside_table(tmp_path, caplog):
+    ref = plan(100e6)
+    cache = CalibrationCache(str(tmp_path))
+    cache.save(ref.freq, -ripple_dB(ref.offsets()), 37.2, RATE, 64, 10, ref.offsets())
+    # Less overlap cropped away, so the edge channels of each hop are outside the reference table
+    wide = plan(100e6, overlap=0.125)
+    with caplog.at_level(logging.WARNING, logger='calibration'):
+        correction_dB = cache.lookup(wide.freq, 37.2, RATE, 64, wide.offsets())
+    outside = (wide.offsets() < ref.offsets().min()) | (wide.offsets() > ref.offsets().max())
+    assert np.count_nonzero(outside) == 2*4*4
+    assert 'outside calibration table' in caplog.text
+    assert np.all(correction_dB[outside] == 0)
+    np.testing.assert_allclose(correction_dB[~outside], -ripple_dB(wide.offsets()[~outside]), atol=0.1)
+
+
+def test_calibrator_apply():
+    correction_dB = np.array([-1.0, 0.0, 3.0])
+    mag_dB = np.array([-80.0, -70.0, -60.0])
+    np.testing.assert_allclose(Calibrator(correction_dB).apply(mag_dB), [-81, -70, -57])
+    mag = np.exp(mag_dB*np.log(10)/10)
+    out = np.empty(3, np.float32)
+    Calibrator(correction_dB, linear=True, dtype=np.float32).apply(mag, out=out)
+    np.testing.assert_allclose(10*np.log10(out), [-81, -70, -57], atol=1e-4)
+    # In place
+    Calibrator(correction_dB).apply(mag_dB, out=mag_dB)
+    np.testing.assert_allclose(mag_dB, [-81, -70, -57])
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import env_sampler
+from env_sampler import EnvSampler
+
+
+class FakeClock:
+    def __init__(self, t=1000.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(env_sampler.time, 'time', clock)
+    return clock
+
+
+def sampler_with_readings(clock, readings, interval=30.0):
+    """Sampler whose stub sensor returns (humidity, temperature) pairs at the given times"""
+    values = iter(readings)
+    sampler = EnvSampler(read_fn=lambda: next(values)[1:], interval=interval)
+    for t, _, _ in readings:
+        clock.t = t
+        sampler.sample()
+    return sampler
+
+
+def test_stub_readings_are_stored(clock):
+    sampler = sampler_with_readings(clock, [(1000.0, 50.0, 20.0), (1030.0, 55.0, 21.0)])
+    t, temperature, humidity = sampler.readings()
+    np.testing.assert_allclose(t, [1000.0, 1030.0])
+    np.testing.assert_allclose(temperature, [20.0, 21.0])
+    np.testing.assert_allclose(humidity, [50.0, 55.0])
+    assert sampler.failed_reads == 0
+
+
+def test_failed_reads_are_counted_and_skipped(clock):
+    responses = iter([(None, None), (40.0, None), (45.0, 19.5)])
+
+    def read_fn():
+        return next(responses)
+
+    def raising_read_fn():
+        raise RuntimeError('sensor unplugged')
+
+    sampler = EnvSampler(read_fn=read_fn)
+    assert not sampler.sample()
+    assert not sampler.sample()
+    assert sampler.sample()
+    sampler._read_fn = raising_read_fn
+    assert not sampler.sample()
+    assert sampler.failed_reads == 3
+    t, temperature, humidity = sampler.readings()
+    np.testing.assert_allclose(temperature, [19.5])
+    np.testing.assert_allclose(humidity, [45.0])
+
+
+def test_interpolate_between_readings(clock):
+    sampler = sampler_with_readings(clock, [(1000.0, 50.0, 20.0), (1030.0, 56.0, 23.0)])
+    temperature, humidity = sampler.interpolate([1000.0, 1010.0, 1030.0])
+    np.testing.assert_allclose(temperature, [20.0, 21.0, 23.0])
+    np.testing.assert_allclose(humidity, [50.0, 52.0, 56.0])
+
+
+def test_interpolate_without_readings_is_nan():
+    temperature, humidity = EnvSampler(read_fn=lambda: (None, None)).interpolate([1000.0, 1001.0])
+    assert np.all(np.isnan(temperature)) and np.all(np.isnan(humidity))
+
+
+def test_interpolate_stale_readings_are_nan(clock):
+    # Sensor stopped responding after the second reading
+    sampler = sampler_with_readings(clock, [(1000.0, 50.0, 20.0), (1030.0, 50.0, 21.0)], interval=30.0)
+    temperature, humidity = sampler.interpolate([1030.0, 1085.0, 1095.0, 930.0, 950.0])
+    np.testing.assert_allclose(temperature[[0, 1, 4]], [21.0, 21.0, 20.0])
+    assert np.isnan(temperature[2]) and np.isnan(humidity[2])
+    assert np.isnan(temperature[3]) and np.isnan(humidity[3])
+    # A gap in the readings longer than max_age is stale in the middle too
+    temperature, humidity = sampler.interpolate([1015.0], max_age=10.0)
+    assert np.isnan(temperature[0]) and np.isnan(humidity[0])
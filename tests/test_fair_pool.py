@@ -0,0 +1,92 @@
+import time
+import threading
+
+import pytest
+
+from fair_pool import FairPool
+
+
+@pytest.fixture
+def pool():
+    pool = FairPool(max_workers=1, max_queue_size=3)
+    yield pool
+    pool.shutdown()
+
+
+def block(pool, client):
+    """Occupy the single worker until the returned event is set"""
+    started, gate = threading.Event(), threading.Event()
+    client.submit(lambda: started.set() or gate.wait(5))
+    assert started.wait(5)
+    return gate
+
+
+def test_clients_served_round_robin(pool):
+    a, b = pool.client('a'), pool.client('b')
+    order = []
+    gate = block(pool, a)
+    futures = [a.submit(order.append, 'a{}'.format(i)) for i in range(3)]
+    futures += [b.submit(order.append, 'b{}'.format(i)) for i in range(2)]
+    gate.set()
+    for future in futures:
+        future.result(5)
+    # Client b is served in turn even though a queued all of its work first
+    assert order == ['b0', 'a0', 'b1', 'a1', 'a2']
+    assert (a.submitted, a.completed, b.submitted, b.completed) == (4, 4, 2, 2)
+
+
+def test_full_queue_blocks_only_its_client(pool):
+    a, b = pool.client('a'), pool.client('b')
+    gate = block(pool, a)
+    for i in range(3):
+        a.submit(time.sleep, 0)
+    assert a.queue_depth() == 3 and a.max_queue_size_reached == 3
+    blocked = threading.Thread(target=a.submit, args=(time.sleep, 0))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    # Other client is not held up by a's full queue
+    future = b.submit(time.sleep, 0)
+    assert b.queue_depth() == 1
+    gate.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    future.result(5)
+
+
+def test_exception_is_set_on_future(pool):
+    future = pool.client('a').submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        future.result(5)
+
+
+def test_shutdown_finishes_queued_work_and_rejects_new():
+    pool = FairPool(max_workers=2, max_queue_size=1)
+    a, b = pool.client('a'), pool.client('b')
+    gates = [block(pool, a), block(pool, b)]
+    queued = a.submit(lambda: 'done')
+    blocked_error = []
+
+    def submit_blocked():
+        try:
+            a.submit(time.sleep, 0)
+        except RuntimeError as e:
+            blocked_error.append(e)
+
+    blocked = threading.Thread(target=submit_blocked)
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    shutdown = threading.Thread(target=pool.shutdown)
+    shutdown.start()
+    blocked.join(5)
+    # Submitter waiting on a full queue is released with an error instead of hanging
+    assert not blocked.is_alive() and blocked_error
+    with pytest.raises(RuntimeError):
+        b.submit(time.sleep, 0)
+    for gate in gates:
+        gate.set()
+    shutdown.join(5)
+    assert not shutdown.is_alive()
+    assert queued.result(0) == 'done'
+    assert not any(t.is_alive() for t in pool._threads)
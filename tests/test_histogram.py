@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+import histogram
+from histogram import PowerHistogram
+
+
+def reference_percentile(hist, q):
+    """Percentile resolved with a full cumulative sum, as in the original implementation"""
+    cum = np.cumsum(hist.counts, axis=1)
+    target = q / 100 * hist.count
+    col = np.argmax(cum >= max(target, 1e-9), axis=1)
+    rows = np.arange(len(col))
+    below = cum[rows, col] - hist.counts[rows, col]
+    frac = (target - below) / np.maximum(hist.counts[rows, col], 1)
+    return np.clip(hist.dB_min + hist.dB_step*(col - 1 + np.clip(frac, 0, 1)), hist.dB_min, hist.dB_max)
+
+
+@pytest.fixture
+def hist(monkeypatch):
+    # Small blocks so that several are resolved, including a partial last one
+    monkeypatch.setattr(histogram, 'CHUNK_ROWS', 7)
+    rng = np.random.default_rng(3)
+    hist = PowerHistogram(30, -100, -60, 0.5)
+    for _ in range(200):
+        mag_dB = rng.normal(-80, 8, 30)
+        mag_dB[0] = -200    # Always underflow
+        mag_dB[1] = 0       # Always overflow
+        hist.update(mag_dB)
+    return hist
+
+
+def test_percentiles_match_full_cumsum(hist):
+    qs = [0, 5, 50, 95, 100]
+    for q, value in zip(qs, hist.percentiles(qs)):
+        np.testing.assert_allclose(value, reference_percentile(hist, q))
+    np.testing.assert_allclose(hist.median(), reference_percentile(hist, 50))
+    assert hist.median()[0] == hist.dB_min and hist.median()[1] == hist.dB_max
+
+
+def test_median_close_to_data():
+    rng = np.random.default_rng(4)
+    hist = PowerHistogram(5, -120, 0, 0.1)
+    data = rng.normal(-70, 5, (2000, 5))
+    for row in data:
+        hist.update(row)
+    np.testing.assert_allclose(hist.median(), np.median(data, axis=0), atol=0.2)
+
+
+def test_empty_histogram_raises():
+    with pytest.raises(ValueError):
+        PowerHistogram(3).median()
+
+
+def test_save_load_roundtrip(hist, tmp_path):
+    fname = str(tmp_path / 'histogram.npz')
+    hist.save(fname)
+    hist.save(fname)    # Replaces existing checkpoint
+    assert os.listdir(str(tmp_path)) == ['histogram.npz']
+    loaded = PowerHistogram.load(fname)
+    np.testing.assert_array_equal(loaded.counts, hist.counts)
+    assert loaded.count == hist.count
+    np.testing.assert_allclose(loaded.median(), hist.median())
+
+
+@pytest.mark.parametrize('dB_min, dB_max, dB_step', [(-90, -20, 0.3), (-100, -20, 0.7)])
+def test_load_keeps_bins_of_rounded_range(tmp_path, dB_min, dB_max, dB_step):
+    # Recomputing the bins from the rounded dB_max gives one more than were saved for these ranges
+    fname = str(tmp_path / 'histogram.npz')
+    hist = PowerHistogram(4, dB_min, dB_max, dB_step)
+    top = np.full(4, hist.dB_max - dB_step/2)
+    hist.update(top)
+    hist.save(fname)
+    loaded = PowerHistogram.load(fname)
+    assert loaded.nbins == hist.nbins and loaded.same_bins(hist)
+    loaded.update(top)
+    loaded.update(np.full(4, 0.0))
+    assert loaded.counts[0, hist.nbins] == 2 and loaded.counts[0, hist.nbins + 1] == 1
+    assert loaded.counts[1:, 0].sum() == 0
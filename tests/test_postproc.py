@@ -0,0 +1,34 @@
+import numpy as np
+
+from postproc import PostProcessor
+
+
+def test_results_in_sweep_order():
+    freq = np.linspace(1e6, 2e6, 16)
+    postProc = PostProcessor(len(freq), constants={'freq': freq}, workers=2, slots=2)
+    try:
+        for Nsweep in range(5):
+            assert postProc.submit(Nsweep, mag_dB=np.full(len(freq), -50.0 - Nsweep))
+    finally:
+        ready = postProc.results() + postProc.close()
+    assert [Nsweep for Nsweep, _ in ready] == list(range(5))
+    np.testing.assert_allclose([result['max'] for _, result in ready], [-50, -51, -52, -53, -54])
+
+
+def test_dead_worker_does_not_block():
+    freq = np.linspace(1e6, 2e6, 16)
+    mag_dB = np.zeros(len(freq))
+    postProc = PostProcessor(len(freq), constants={'freq': freq}, workers=1, slots=1, policy='block')
+    try:
+        assert postProc.submit(0, mag_dB=mag_dB)
+        postProc.results(wait=True)
+        postProc._workers[0].kill()
+        postProc._workers[0].join()
+        # Blocking policy with no timeout would wait forever on a dead worker
+        postProc.submit(1, mag_dB=mag_dB)
+        assert not postProc.submit(2, mag_dB=mag_dB)
+        assert postProc.failed
+        assert postProc.queue_depth() == 0
+    finally:
+        ready = postProc.close()
+    assert ready == []
@@ -0,0 +1,75 @@
+import os
+import argparse
+import datetime
+
+import numpy as np
+import pytest
+
+from postproc import PostProcessor
+from products import CampaignProducts
+
+
+def campaign_args(**kwargs):
+    """Product related run_campaign.py arguments with their defaults"""
+    args = dict(float32=False, cal_build=0, cal_apply=False, cal_dir='', specific_gains={}, gain=37.2, rate=2.4e6,
+                bins=64, linear=False, hist_step=0.5, hist_min=-120, hist_max=0, hist_every=3, hist_resume=False,
+                occupancy_threshold=-75, allan_scales=3, allan_every=4, allan_bands=2,
+                windows={'1m': (60.0, 6)})
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def sweeps(n=10, bins=64):
+    rng = np.random.default_rng(8)
+    t0 = datetime.datetime(2024, 1, 1)
+    freq = np.linspace(100e6, 101e6, bins)
+    for i in range(n):
+        start = t0 + datetime.timedelta(seconds=20*i)
+        yield i, freq, rng.normal(-80, 3, bins), start, start + datetime.timedelta(seconds=15)
+
+
+def read_products(path):
+    return {fname: open(os.path.join(path, fname), 'rb').read()
+            for fname in sorted(os.listdir(path)) if fname.endswith('.txt')}
+
+
+def test_products_in_worker_match_inline(tmp_path):
+    inline_path, worker_path = str(tmp_path / 'inline') + '/', str(tmp_path / 'worker') + '/'
+    os.makedirs(inline_path)
+    os.makedirs(worker_path)
+    products = CampaignProducts(campaign_args(), inline_path)
+    for Nsweep, freq, mag_dB, start, end in sweeps():
+        products(Nsweep, freq, mag_dB, start, end)
+    products.close()
+
+    stage = PostProcessor(64, task=CampaignProducts(campaign_args(), worker_path),
+                          constants={'freq': next(sweeps())[1]}, workers=1, slots=2)
+    try:
+        for Nsweep, freq, mag_dB, start, end in sweeps():
+            assert stage.submit(Nsweep, info={'start': start, 'end': end}, mag_dB=mag_dB)
+    finally:
+        stage.close(timeout=None)
+    assert stage.errors == 0
+
+    inline, worker = read_products(inline_path), read_products(worker_path)
+    assert {'magFull.txt', 'magMax.txt', 'magMean_1m.txt', 'magMedian.txt', 'allanTau.txt'} <= set(inline)
+    assert inline == worker
+    assert len(inline['magFull.txt'].splitlines()) == 10
+    assert os.path.exists(worker_path + 'histogram.npz')
+
+
+def test_resume_rejects_different_histogram_range(tmp_path):
+    path = str(tmp_path) + '/'
+    products = CampaignProducts(campaign_args(), path)
+    for Nsweep, freq, mag_dB, start, end in sweeps(3):
+        products(Nsweep, freq, mag_dB, start, end)
+    products.close()
+
+    resumed = CampaignProducts(campaign_args(hist_resume=True), path)
+    for Nsweep, freq, mag_dB, start, end in sweeps(3):
+        resumed(Nsweep, freq, mag_dB, start, end)
+    assert resumed.histogram.count == 6
+
+    changed = CampaignProducts(campaign_args(hist_resume=True, hist_step=0.3), path)
+    with pytest.raises(ValueError):
+        changed(*next(sweeps()))
@@ -0,0 +1,72 @@
+import os
+import time
+import shutil
+import socket
+import tempfile
+
+import numpy as np
+import pytest
+
+from sweep_stream import SweepPublisher, SweepSubscriber, encode_message, PREFIX, MAGIC
+
+
+@pytest.fixture
+def sock_path():
+    # Unix socket paths are limited to about 100 characters, so keep them short
+    path = tempfile.mkdtemp(prefix='sksw')
+    yield os.path.join(path, 's.sock')
+    shutil.rmtree(path)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_encode_message_framing():
+    message = encode_message({'type': 'sweep'}, b'abcd')
+    magic, header_len, payload_len = PREFIX.unpack(message[:PREFIX.size])
+    assert magic == MAGIC and payload_len == 4
+    assert message[PREFIX.size + header_len:] == b'abcd'
+
+
+def test_subscriber_receives_plan_and_sweeps(sock_path):
+    publisher = SweepPublisher(sock_path)
+    freq = np.linspace(100e6, 101e6, 8)
+    publisher.publish_plan(freq, 'abc')
+    subscriber = SweepSubscriber(sock_path)
+    try:
+        assert wait_for(lambda: publisher.subscriber_count() == 1)
+        publisher.publish(0, np.arange(8) - 80.0, 'start', 'end', 'abc')
+        header, data = subscriber.receive()
+        assert header['type'] == 'plan' and header['bins'] == 8 and header['settings_hash'] == 'abc'
+        np.testing.assert_array_equal(data, freq)
+        header, data = subscriber.receive()
+        assert header['type'] == 'sweep' and header['Nsweep'] == 0 and header['start'] == 'start'
+        np.testing.assert_array_equal(data, np.arange(8, dtype=np.float32) - 80)
+    finally:
+        subscriber.close()
+        publisher.close()
+    assert not os.path.exists(sock_path)
+
+
+def test_stalled_subscriber_is_dropped_without_blocking(sock_path):
+    publisher = SweepPublisher(sock_path, queue_size=2, max_drops=5)
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stalled.connect(sock_path)      # Never reads
+    try:
+        assert wait_for(lambda: publisher.subscriber_count() == 1)
+        mag_dB = np.zeros(250000)   # 1 MB per message fills the socket buffer after a few sweeps
+        t_start = time.time()
+        for Nsweep in range(50):
+            publisher.publish(Nsweep, mag_dB, 'start', 'end')
+        assert time.time() - t_start < 5
+        assert wait_for(lambda: publisher.subscriber_count() == 0)
+        assert publisher.published == 50
+    finally:
+        stalled.close()
+        publisher.close()